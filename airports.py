@@ -0,0 +1,243 @@
+import math
+import sys
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# IATA metropolitan-area codes and the airports they cover
+METRO_AREAS: Dict[str, Tuple[str, ...]] = {
+    "NYC": ("JFK", "LGA", "EWR"),
+    "CHI": ("ORD", "MDW"),
+    "WAS": ("IAD", "DCA", "BWI"),
+    "HOU": ("IAH", "HOU"),
+    "DTT": ("DTW",),
+    "QSF": ("SFO", "OAK", "SJC"),
+    "QLA": ("LAX", "BUR", "LGB", "ONT", "SNA"),
+    "YTO": ("YYZ", "YTZ"),
+    "YMQ": ("YUL",),
+    "SAO": ("GRU", "CGH", "VCP"),
+    "BUE": ("EZE", "AEP"),
+    "LON": ("LHR", "LGW", "STN", "LTN", "LCY", "SEN"),
+    "PAR": ("CDG", "ORY"),
+    "MIL": ("MXP", "LIN", "BGY"),
+    "ROM": ("FCO", "CIA"),
+    "STO": ("ARN", "BMA"),
+    "MOW": ("SVO", "DME", "VKO"),
+    "TYO": ("HND", "NRT"),
+    "OSA": ("KIX", "ITM"),
+    "SEL": ("ICN", "GMP"),
+    "BJS": ("PEK", "PKX"),
+    "SHA": ("PVG", "SHA"),
+}
+
+
+def is_metro_code(code: str) -> bool:
+    return code.upper() in METRO_AREAS
+
+
+def expand_location(code: str) -> List[str]:
+    """
+    Airports to search for a user-entered code: every airport of a metro area,
+    or the code itself if it is a plain airport.
+    """
+    code = code.upper().strip()
+    return list(METRO_AREAS.get(code, (code,)))
+
+
+# Airports with award-chart coverage: IATA code, latitude, longitude, award zone.
+# Kept as one compact string and parsed on first use.
+AIRPORT_DATA = """
+JFK 40.64 -73.78 north_america
+LGA 40.78 -73.87 north_america
+EWR 40.69 -74.17 north_america
+BOS 42.36 -71.01 north_america
+PHL 39.87 -75.24 north_america
+IAD 38.95 -77.46 north_america
+DCA 38.85 -77.04 north_america
+BWI 39.18 -76.67 north_america
+ATL 33.64 -84.43 north_america
+CLT 35.21 -80.94 north_america
+RDU 35.88 -78.79 north_america
+BNA 36.12 -86.68 north_america
+MIA 25.79 -80.29 north_america
+FLL 26.07 -80.15 north_america
+MCO 28.43 -81.31 north_america
+TPA 27.98 -82.53 north_america
+ORD 41.98 -87.90 north_america
+MDW 41.79 -87.75 north_america
+DTW 42.21 -83.35 north_america
+MSP 44.88 -93.22 north_america
+STL 38.75 -90.37 north_america
+DFW 32.90 -97.04 north_america
+DAL 32.85 -96.85 north_america
+IAH 29.98 -95.34 north_america
+HOU 29.65 -95.28 north_america
+AUS 30.19 -97.67 north_america
+SAT 29.53 -98.47 north_america
+MSY 29.99 -90.26 north_america
+DEN 39.86 -104.67 north_america
+PHX 33.43 -112.01 north_america
+LAS 36.08 -115.15 north_america
+SLC 40.79 -111.98 north_america
+LAX 33.94 -118.41 north_america
+BUR 34.20 -118.36 north_america
+LGB 33.82 -118.15 north_america
+ONT 34.06 -117.60 north_america
+SNA 33.68 -117.87 north_america
+SAN 32.73 -117.19 north_america
+SFO 37.62 -122.38 north_america
+OAK 37.72 -122.22 north_america
+SJC 37.36 -121.93 north_america
+SEA 47.45 -122.31 north_america
+PDX 45.59 -122.60 north_america
+ANC 61.17 -150.00 north_america
+YYZ 43.68 -79.63 north_america
+YTZ 43.63 -79.40 north_america
+YUL 45.47 -73.74 north_america
+YVR 49.19 -123.18 north_america
+YYC 51.13 -114.01 north_america
+HNL 21.32 -157.92 hawaii
+OGG 20.90 -156.43 hawaii
+MEX 19.44 -99.07 central_america
+CUN 21.04 -86.87 central_america
+SJU 18.44 -66.00 central_america
+PTY 9.07 -79.38 central_america
+SJO 9.99 -84.21 central_america
+GRU -23.43 -46.47 south_america
+CGH -23.63 -46.66 south_america
+VCP -23.01 -47.13 south_america
+GIG -22.81 -43.25 south_america
+EZE -34.82 -58.54 south_america
+AEP -34.56 -58.42 south_america
+SCL -33.39 -70.79 south_america
+BOG 4.70 -74.15 south_america
+LIM -12.02 -77.11 south_america
+LHR 51.47 -0.45 europe
+LGW 51.15 -0.19 europe
+STN 51.89 0.24 europe
+LTN 51.87 -0.37 europe
+LCY 51.51 0.06 europe
+SEN 51.57 0.70 europe
+CDG 49.01 2.55 europe
+ORY 48.72 2.38 europe
+AMS 52.31 4.76 europe
+FRA 50.03 8.56 europe
+MUC 48.35 11.79 europe
+ZRH 47.46 8.55 europe
+VIE 48.11 16.57 europe
+MAD 40.47 -3.56 europe
+BCN 41.30 2.08 europe
+LIS 38.78 -9.14 europe
+DUB 53.42 -6.27 europe
+MXP 45.63 8.72 europe
+LIN 45.45 9.28 europe
+BGY 45.67 9.70 europe
+FCO 41.80 12.25 europe
+CIA 41.80 12.59 europe
+CPH 55.62 12.66 europe
+OSL 60.19 11.10 europe
+ARN 59.65 17.92 europe
+BMA 59.35 17.94 europe
+HEL 60.32 24.96 europe
+ATH 37.94 23.94 europe
+IST 41.26 28.74 europe
+SVO 55.97 37.41 europe
+DME 55.41 37.91 europe
+VKO 55.59 37.26 europe
+TLV 32.01 34.89 middle_east
+DXB 25.25 55.36 middle_east
+AUH 24.43 54.65 middle_east
+DOH 25.27 51.61 middle_east
+CAI 30.12 31.41 africa
+ADD 8.98 38.80 africa
+NBO -1.32 36.93 africa
+LOS 6.58 3.32 africa
+JNB -26.14 28.25 africa
+CPT -33.97 18.60 africa
+HND 35.55 139.78 north_asia
+NRT 35.77 140.39 north_asia
+KIX 34.43 135.24 north_asia
+ITM 34.79 135.44 north_asia
+ICN 37.46 126.44 north_asia
+GMP 37.56 126.79 north_asia
+PEK 40.08 116.58 north_asia
+PKX 39.51 116.41 north_asia
+PVG 31.14 121.81 north_asia
+SHA 31.20 121.34 north_asia
+HKG 22.31 113.91 north_asia
+TPE 25.08 121.23 north_asia
+SIN 1.36 103.99 south_asia
+BKK 13.69 100.75 south_asia
+KUL 2.75 101.71 south_asia
+MNL 14.51 121.02 south_asia
+DEL 28.56 77.10 south_asia
+BOM 19.09 72.87 south_asia
+SYD -33.95 151.18 oceania
+MEL -37.67 144.84 oceania
+BNE -27.38 153.12 oceania
+AKL -37.01 174.79 oceania
+"""
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def great_circle_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Haversine distance in statute miles.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+class AirportTable:
+    """
+    Every pairwise distance precomputed once into a flat uint16 array (whole miles),
+    so a lookup is two dict hits and an index. ~130 airports take ~34 KB.
+    """
+
+    __slots__ = ("index", "zones", "distances")
+
+    def __init__(self, data: str = AIRPORT_DATA):
+        rows = [line.split() for line in data.strip().splitlines()]
+        self.index: Dict[str, int] = {code: i for i, (code, _, _, _) in enumerate(rows)}
+        self.zones: Tuple[str, ...] = tuple(sys.intern(zone) for _, _, _, zone in rows)
+        coords = [(float(lat), float(lon)) for _, lat, lon, _ in rows]
+        n = len(rows)
+        self.distances = array("H", bytes(2 * n * n))
+        for i in range(n):
+            for j in range(i + 1, n):
+                miles = round(great_circle_miles(*coords[i], *coords[j]))
+                self.distances[i * n + j] = self.distances[j * n + i] = miles
+
+    def distance(self, origin: str, destination: str) -> Optional[int]:
+        i = self.index.get(origin)
+        j = self.index.get(destination)
+        if i is None or j is None:
+            return None
+        return self.distances[i * len(self.index) + j]
+
+    def zone(self, code: str) -> Optional[str]:
+        i = self.index.get(code)
+        return self.zones[i] if i is not None else None
+
+
+@lru_cache(maxsize=1)
+def airport_table() -> AirportTable:
+    """
+    The process-wide airport table, built on first use (a few ms).
+    """
+    return AirportTable()
+
+
+def distance_miles(origin: str, destination: str) -> Optional[int]:
+    """
+    Great-circle miles between two airports, or None if either is not in the table.
+    """
+    return airport_table().distance(origin, destination)
+
+
+def airport_zone(code: str) -> Optional[str]:
+    return airport_table().zone(code)
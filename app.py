@@ -1,44 +1,334 @@
+import gzip
+import hashlib
+import json
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+from flask import Flask, Response, g, render_template, request, redirect, session, stream_with_context, url_for, flash
 from dotenv import load_dotenv
-from recommender import recommend_best_redemptions
-from sql_lite import insert_feedback
+import profiling
+import value_calc
+from award_charts import AWARD_CHARTS, DEFAULT_AWARD_PROGRAM
+from export import EXPORT_FORMATS, MIMETYPES, iter_export
+from metrics import HTTP_REQUEST_SECONDS, HTTP_RESPONSES, REGISTRY, span
+from pricing import priced_offers, pricing_key
+from recommender import recommend_best_redemptions_async, search_queries
+from routing import cached_routes, offer_cache, search_stored_at
+from sql_lite import get_feedback_aggregates, get_offer_store, insert_feedback
 from value_calc import example_calculations
 
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
 load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("APP_SECRET_KEY", "dev")
+app.jinja_env.globals.update(award_charts=AWARD_CHARTS, default_award_program=DEFAULT_AWARD_PROGRAM)
+
+
+@app.before_request
+def _start_request():
+    g.request_started = time.perf_counter()
+    if profiling.PROFILE_ENABLED:
+        mode = request.headers.get(profiling.PROFILE_HEADER)
+        if mode:
+            g.profiler = profiling.start_profile(mode)
+
+
+@app.after_request
+def _finish_request(resp: Response) -> Response:
+    endpoint = request.endpoint or "unmatched"
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint)
+    HTTP_RESPONSES.inc(endpoint, str(resp.status_code))
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        resp.headers["X-Profile-File"] = str(profiling.finish_profile(profiler, endpoint))
+    return resp
+
+
+@app.teardown_request
+def _stop_profiler(exc):
+    # Requests that raised never reach after_request
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Rendered landing pages keyed by CPM configuration: (body, etag, last_modified)
+_index_pages = {}
+_index_pages_lock = threading.Lock()
+
+
+def _render_index() -> str:
+    with span("app.render"):
+        return render_template("index.html", results=None, examples=example_calculations())
 
 
 @app.get("/")
 def index():
-    examples = example_calculations()
-    return render_template("index.html", results=None, examples=examples)
+    if request.cookies.get(app.config["SESSION_COOKIE_NAME"]) and session.get("_flashes"):
+        # Flashed messages are per-visitor; render fresh and keep it out of shared caches
+        resp = Response(_render_index(), mimetype="text/html")
+        resp.cache_control.private = True
+        resp.cache_control.no_store = True
+        return resp
+
+    key = (value_calc.FLIGHT_AWARD_CPM, value_calc.HOTEL_CPM, value_calc.GIFT_CARD_CPM)
+    page = _index_pages.get(key)
+    if page is None:
+        body = _render_index()
+        page = (body, hashlib.sha1(body.encode("utf-8")).hexdigest(), datetime.now(timezone.utc).replace(microsecond=0))
+        with _index_pages_lock:
+            page = _index_pages.setdefault(key, page)
+
+    body, etag, last_modified = page
+    resp = Response(body, mimetype="text/html")
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    # Let browsers and the CDN keep a copy but revalidate it (cheap 304) on every use
+    resp.cache_control.public = True
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
 
 
 @app.post("/recommend")
-def recommend():
+async def recommend():
     origin = request.form.get("origin", "").upper().strip()
     destination = request.form.get("destination", "").upper().strip()
     departure_date = request.form.get("departure_date", "").strip()
-    miles_available = int(request.form.get("miles_available", "0"))
-    results = recommend_best_redemptions(origin, destination, departure_date, miles_available)
+    try:
+        miles_available = int(request.form.get("miles_available", "0"))
+        flex_days = int(request.form.get("flex_days", "0") or 0)
+    except ValueError:
+        return _form_error("Miles available and flexible days must be whole numbers.")
+    if not _is_iso_date(departure_date):
+        return _form_error("Departure date must be a valid date (YYYY-MM-DD).")
+    program = request.form.get("program", "").strip().lower()
+    if program not in AWARD_CHARTS:
+        program = DEFAULT_AWARD_PROGRAM
+    results = await recommend_best_redemptions_async(
+        origin, destination, departure_date, miles_available, flex_days=flex_days, program=program
+    )
     examples = example_calculations()
-    return render_template(
-        "index.html",
-        results=results,
-        origin=origin,
-        destination=destination,
-        departure_date=departure_date,
-        miles_available=miles_available,
-        examples=examples,
+    with span("app.render"):
+        return render_template(
+            "index.html",
+            results=results,
+            origin=origin,
+            destination=destination,
+            departure_date=departure_date,
+            miles_available=miles_available,
+            flex_days=flex_days,
+            program=program,
+            examples=examples,
+        )
+
+
+def _form_error(message: str) -> Response:
+    # Re-render the search form with what the user typed and the reason it was rejected
+    flash(message)
+    form = {k: request.form.get(k, "") for k in ("origin", "destination", "departure_date", "miles_available",
+                                                  "flex_days", "program")}
+    with span("app.render"):
+        body = render_template("index.html", results=None, examples=example_calculations(), **form)
+    return Response(body, status=400, mimetype="text/html")
+
+
+def _is_iso_date(value: str) -> bool:
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+# Responses smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 512
+
+
+@app.get("/api/recommend")
+async def api_recommend():
+    """
+    JSON recommendations. Query parameters: origin, destination, departure_date,
+    miles_available, flex_days, program (award chart, see award_charts.AWARD_CHARTS),
+    and optionally `fields` (comma-separated keys to keep on each recommendation)
+    or `omit` (keys to drop, e.g. omit=segments).
+    """
+    args = request.args
+    origin = args.get("origin", "").upper().strip()
+    destination = args.get("destination", "").upper().strip()
+    departure_date = args.get("departure_date", "").strip()
+    try:
+        miles_available = int(args.get("miles_available", "0"))
+        flex_days = int(args.get("flex_days", "0") or 0)
+    except ValueError:
+        return _json_error("miles_available and flex_days must be integers")
+    if not origin or not destination or not departure_date:
+        return _json_error("origin, destination and departure_date are required")
+    if not _is_iso_date(departure_date):
+        return _json_error("departure_date must be an ISO date (YYYY-MM-DD)")
+    program = args.get("program", "").strip().lower() or DEFAULT_AWARD_PROGRAM
+    if program not in AWARD_CHARTS:
+        return _json_error(f"unknown award program; choose one of {', '.join(sorted(AWARD_CHARTS))}")
+    fields = _csv_arg("fields")
+    omit = _csv_arg("omit")
+
+    queries = search_queries(origin, destination, departure_date, flex_days=flex_days)
+    versions = _recommend_versions(queries)
+    etag = _recommend_etag(versions)
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.vary.add("Accept-Encoding")
+        resp.set_etag(etag, weak=True)
+        resp.cache_control.public = True
+        resp.cache_control.max_age = _fresh_for(versions)
+        return resp
+
+    results = await recommend_best_redemptions_async(
+        origin, destination, departure_date, miles_available, flex_days=flex_days, program=program
+    )
+    if fields or omit:
+        results = dict(results)
+        results["recommendations"] = [_select_fields(r, fields, omit) for r in results["recommendations"]]
+    with span("app.serialize"):
+        body = json.dumps(results, separators=(",", ":")).encode("utf-8")
+
+    # Searches are now cached unless they fell back to mock data
+    versions = _recommend_versions(queries)
+    etag = _recommend_etag(versions)
+    resp = _compressed_json(body)
+    if etag is not None:
+        resp.set_etag(etag, weak=True)
+        resp.cache_control.public = True
+        resp.cache_control.max_age = _fresh_for(versions)
+        if offer_cache.stale_ttl > 0:
+            resp.cache_control.stale_while_revalidate = int(offer_cache.stale_ttl)
+    else:
+        resp.cache_control.no_cache = True
+    return resp
+
+
+@app.get("/api/export")
+def api_export():
+    """
+    Streams stored offers as an itinerary report. Query parameters: format (text,
+    csv or ndjson; default csv) and optional origin, destination, departure_date
+    and since_hours filters. The body is generated while it is sent, so large
+    exports use constant memory; it is not compressed or cached.
+    """
+    args = request.args
+    fmt = args.get("format", "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        return _json_error(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    try:
+        since_hours = float(args["since_hours"]) if args.get("since_hours") else None
+    except ValueError:
+        return _json_error("since_hours must be a number")
+    since = time.time() - since_hours * 3600 if since_hours is not None else None
+    offers = get_offer_store().iter_offers(
+        args.get("origin", "").upper().strip() or None,
+        args.get("destination", "").upper().strip() or None,
+        args.get("departure_date", "").strip() or None,
+        since,
     )
+    resp = Response(stream_with_context(iter_export(offers, fmt)), mimetype=MIMETYPES[fmt])
+    extension = "txt" if fmt == "text" else fmt
+    resp.headers["Content-Disposition"] = f"attachment; filename=itineraries.{extension}"
+    resp.cache_control.no_store = True
+    return resp
+
+
+def _json_error(message: str, status: int = 400) -> Response:
+    return Response(json.dumps({"error": message}), status=status, mimetype="application/json")
+
+
+def _csv_arg(name: str) -> List[str]:
+    return [v.strip() for v in request.args.get(name, "").split(",") if v.strip()]
+
+
+def _select_fields(item: Dict, fields: List[str], omit: List[str]) -> Dict:
+    if fields:
+        item = {k: v for k, v in item.items() if k in fields or k == "type"}
+    return {k: v for k, v in item.items() if k not in omit}
+
+
+def _recommend_versions(queries) -> Optional[Dict]:
+    """
+    Everything the recommendations for these searches depend on besides the query:
+    the cache stamp of every search, the stamp of every confirmed price held for their
+    routes, and the route ratings used as a tiebreak. None if any search is not
+    currently cached (or ratings cannot be read), so the response is not cacheable.
+    """
+    searches, priced = [], []
+    for origin, destination, departure_date in queries:
+        stored_at = search_stored_at(origin, destination, departure_date)
+        routes = cached_routes(origin, destination, departure_date)
+        if stored_at is None or routes is None:
+            return None
+        searches.append(stored_at)
+        for r in routes:
+            key = pricing_key(r)
+            confirmed_at = priced_offers.stored_at(key)
+            if confirmed_at is not None:
+                priced.append((key, confirmed_at))
+    try:
+        ratings = get_feedback_aggregates().route_ratings({(o, d) for o, d, _ in queries})
+    except sqlite3.Error:
+        return None
+    return {"searches": searches, "priced": sorted(priced), "ratings": sorted(ratings.items())}
+
+
+def _recommend_etag(versions: Optional[Dict]) -> Optional[str]:
+    """
+    Weak ETag from the full query string plus _recommend_versions, or None if the
+    response is not cacheable.
+    """
+    if versions is None:
+        return None
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    return hashlib.sha1(f"{query}|{versions!r}".encode("utf-8")).hexdigest()
+
+
+def _fresh_for(versions: Dict) -> int:
+    # Seconds until the first search or confirmed price behind the response leaves its cache
+    expiries = [stamp + offer_cache.ttl for stamp in versions["searches"]]
+    expiries += [stamp + priced_offers.ttl for _, stamp in versions["priced"]]
+    return max(int(min(expiries) - time.time()), 0)
+
+
+def _compressed_json(body: bytes) -> Response:
+    resp = Response(mimetype="application/json")
+    resp.vary.add("Accept-Encoding")
+    encoding = None
+    if len(body) >= COMPRESS_MIN_BYTES:
+        offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+        encoding = request.accept_encodings.best_match(offered)
+    if encoding == "br":
+        body = brotli.compress(body)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=5)
+    if encoding:
+        resp.content_encoding = encoding
+    resp.set_data(body)
+    return resp
 
 
 @app.post("/feedback")
 def feedback():
-    origin = request.form.get("origin", "")
-    destination = request.form.get("destination", "")
+    # Ratings are looked up per airport pair, so a metro search (NYC) is rated
+    # against the airports of the top flight it recommended
+    origin = (request.form.get("rated_origin") or request.form.get("origin", "")).upper().strip()
+    destination = (request.form.get("rated_destination") or request.form.get("destination", "")).upper().strip()
     departure_date = request.form.get("departure_date", "")
     miles_available = int(request.form.get("miles_available", "0"))
     rating = int(request.form.get("rating", "0"))
@@ -0,0 +1,126 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional, Sequence, Tuple
+
+from airports import airport_zone, distance_miles
+
+# Program used to price flight awards unless a request names another
+DEFAULT_AWARD_PROGRAM = os.getenv("AWARD_PROGRAM", "avios")
+
+# Amadeus cabin names; award prices below are listed in this order
+CABINS = ("ECONOMY", "PREMIUM_ECONOMY", "BUSINESS", "FIRST")
+
+Prices = Tuple[int, int, int, int]
+
+
+@dataclass(frozen=True, slots=True)
+class AwardChart:
+    """
+    One-way saver award prices for a loyalty program.
+
+    `bands` maps great-circle distance to miles: the first band whose upper limit
+    (miles) covers the distance applies. Zone charts list prices per unordered
+    zone pair in `zones`, with `short_haul` for trips within one zone of at most
+    `short_haul_miles`, and fall back to `bands` for pairs they do not list.
+    Per-segment charts price every flight separately and add them up; the others
+    price origin to final destination.
+    """
+    program: str
+    name: str
+    bands: Tuple[Tuple[int, Prices], ...]
+    per_segment: bool = False
+    zones: Dict[FrozenSet[str], Prices] = field(default_factory=dict)
+    short_haul_miles: int = 0
+    short_haul: Optional[Prices] = None
+
+    def leg_miles(self, origin: str, destination: str, cabin: int = 0) -> Optional[int]:
+        distance = distance_miles(origin, destination)
+        if distance is None:
+            return None
+        if self.zones:
+            zone_a, zone_b = airport_zone(origin), airport_zone(destination)
+            if zone_a == zone_b and self.short_haul and distance <= self.short_haul_miles:
+                return self.short_haul[cabin]
+            prices = self.zones.get(frozenset((zone_a, zone_b)))
+            if prices is not None:
+                return prices[cabin]
+        for limit, prices in self.bands:
+            if distance <= limit:
+                return prices[cabin]
+        return self.bands[-1][1][cabin]
+
+    def miles_for(self, legs: Sequence[Tuple[str, str]], cabin: str = "ECONOMY") -> Optional[int]:
+        """
+        Award miles for an itinerary given as (from, to) airport legs, or None if
+        any airport is not in the distance table.
+        """
+        if not legs:
+            return None
+        index = CABINS.index(cabin) if cabin in CABINS else 0
+        if not self.per_segment:
+            return self.leg_miles(legs[0][0], legs[-1][1], index)
+        total = 0
+        for origin, destination in legs:
+            miles = self.leg_miles(origin, destination, index)
+            if miles is None:
+                return None
+            total += miles
+        return total
+
+
+def _zones(*pairs: Tuple[str, str, Prices]) -> Dict[FrozenSet[str], Prices]:
+    return {frozenset((a, b)): prices for a, b, prices in pairs}
+
+
+# Representative saver levels; real charts change often and vary by season and partner
+AWARD_CHARTS: Dict[str, AwardChart] = {
+    "avios": AwardChart(
+        program="avios",
+        name="Distance-based, per segment (Avios-style)",
+        per_segment=True,
+        bands=(
+            (650, (6000, 9000, 12500, 19000)),
+            (1150, (9000, 13500, 18000, 27000)),
+            (2000, (11000, 17500, 27000, 40500)),
+            (3000, (13000, 21000, 34000, 51000)),
+            (4000, (20000, 30000, 50000, 68000)),
+            (5500, (25750, 38500, 62750, 85000)),
+            (6500, (31000, 46500, 75000, 100000)),
+            (7000, (35000, 52500, 85000, 115000)),
+            (65535, (50000, 75000, 100000, 150000)),
+        ),
+    ),
+    "mileageplus": AwardChart(
+        program="mileageplus",
+        name="Zone-based, origin to destination (MileagePlus-style)",
+        zones=_zones(
+            ("north_america", "north_america", (12500, 20000, 25000, 35000)),
+            ("north_america", "hawaii", (22500, 35000, 40000, 60000)),
+            ("north_america", "central_america", (17500, 25000, 35000, 50000)),
+            ("north_america", "south_america", (30000, 45000, 60000, 90000)),
+            ("north_america", "europe", (30000, 45000, 60000, 110000)),
+            ("north_america", "middle_east", (42500, 60000, 80000, 120000)),
+            ("north_america", "africa", (40000, 60000, 80000, 120000)),
+            ("north_america", "north_asia", (35000, 55000, 80000, 110000)),
+            ("north_america", "south_asia", (40000, 60000, 85000, 120000)),
+            ("north_america", "oceania", (40000, 60000, 80000, 120000)),
+            ("europe", "europe", (15000, 20000, 25000, 35000)),
+            ("europe", "middle_east", (20000, 30000, 40000, 55000)),
+            ("europe", "north_asia", (40000, 60000, 70000, 100000)),
+        ),
+        short_haul_miles=700,
+        short_haul=(10000, 15000, 17500, 25000),
+        bands=(
+            (2000, (15000, 22500, 30000, 45000)),
+            (5000, (30000, 45000, 60000, 90000)),
+            (65535, (45000, 67500, 90000, 130000)),
+        ),
+    ),
+}
+
+
+def get_award_chart(program: Optional[str] = None) -> AwardChart:
+    """
+    The chart for `program` (default DEFAULT_AWARD_PROGRAM); raises KeyError for unknown programs.
+    """
+    return AWARD_CHARTS[program or DEFAULT_AWARD_PROGRAM]
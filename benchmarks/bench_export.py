@@ -0,0 +1,113 @@
+"""
+Itinerary report rendering: the original simplify_offers + simplify_data string
+build vs the streaming export pipeline (text, CSV and NDJSON), written to a file.
+
+    python benchmarks/bench_export.py --offers 1000 10000 50000 --segments 2
+
+Peak memory is what the export allocates beyond the already-loaded offers
+(tracemalloc), so it shows the report string vs the streaming write buffer.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reference  # noqa: E402
+from benchmarks.fixtures import generate_offers  # noqa: E402
+from export import EXPORT_FORMATS, write_export  # noqa: E402
+
+
+def legacy_iso_to_readable(iso):
+    return datetime.fromisoformat(iso).strftime("%B %d, %Y at %I:%M %p")
+
+
+def legacy_simplify_data(simplified_offers):
+    # The pre-export simplify_data: list of routes, `final +=` and a timestamp parse per segment
+    routes = []
+    current_route = []
+    for flight in simplified_offers:
+        if not current_route:
+            current_route.append(flight)
+        else:
+            last_arrival = current_route[-1]["arrival_airport"]
+            if last_arrival == flight["departure_airport"]:
+                current_route.append(flight)
+            else:
+                routes.append(current_route)
+                current_route = [flight]
+    if current_route:
+        routes.append(current_route)
+
+    final = ""
+    route_num = 1
+    for route in routes:
+        if len(route) > 1:
+            final += f"Route {route_num}: Connecting flight with {len(route)} segments\n\n"
+        else:
+            final += f"Route {route_num}: Direct flight\n\n"
+        for i, flight in enumerate(route, start=1):
+            final += f"  Segment {i}: {flight.get('departure_airport')} --> {flight.get('arrival_airport')}\n"
+            final += f"    Flight Code: {flight.get('flight_code')}\n"
+            final += f"    Airline Code: {flight.get('airline_code')}\n"
+            final += f"    Departure: {legacy_iso_to_readable(flight.get('departure_time'))} from {flight.get('departure_airport')}\n"
+            final += f"    Arrival:   {legacy_iso_to_readable(flight.get('arrival_time'))} at {flight.get('arrival_airport')}\n"
+            final += f"    Price:     {flight.get('price')}\n\n"
+        route_num += 1
+    return final
+
+
+def legacy(offers, path):
+    report = legacy_simplify_data(reference.simplify_offers({"data": offers}))
+    with open(path, "w", encoding="utf-8") as fp:
+        return fp.write(report)
+
+
+def streaming(fmt):
+    def run(offers, path):
+        with open(path, "w", encoding="utf-8", newline="") as fp:
+            return write_export(offers, fp, fmt)
+    return run
+
+
+def measure(fn, offers, path, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        reference.iso_to_readable.cache_clear()
+        start = time.perf_counter()
+        fn(offers, path)
+        best = min(best, time.perf_counter() - start)
+    reference.iso_to_readable.cache_clear()
+    tracemalloc.start()
+    fn(offers, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, path.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--segments", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    runners = [("legacy text", legacy)] + [(f"stream {fmt}", streaming(fmt)) for fmt in EXPORT_FORMATS]
+    print(f"{'offers':>8} {'pipeline':<14} {'best ms':>10} {'offers/s':>12} {'peak KiB':>10} {'file KiB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "report.out"
+        for n in args.offers:
+            offers = generate_offers(n, args.segments)["data"]
+            for name, fn in runners:
+                elapsed, peak, size = measure(fn, offers, path, args.repeat)
+                print(f"{n:>8} {name:<14} {elapsed * 1000:>10.1f} {n / elapsed:>12,.0f} "
+                      f"{peak / 1024:>10,.0f} {size / 1024:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Feedback write throughput under concurrent writers: the old connect-per-insert
+path vs FeedbackWriter (direct and buffered).
+
+    python benchmarks/bench_feedback.py --threads 8 --writes 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sql_lite  # noqa: E402
+from sql_lite import FEEDBACK_INSERT, FeedbackWriter  # noqa: E402
+
+ROW = ("JFK", "LAX", "2025-09-01", 25000, 5, "Great!")
+
+
+def connect_per_insert(path):
+    # The pre-FeedbackWriter insert: new connection and schema check on every call
+    def insert(*row):
+        sql_lite.DB_PATH = path
+        conn = sql_lite.get_conn()
+        with conn:
+            conn.execute(FEEDBACK_INSERT, row)
+        conn.close()
+    return insert, lambda: None
+
+
+def writer(path, buffered):
+    w = FeedbackWriter(path, buffered=buffered)
+    return w.insert, w.close
+
+
+def run(name, factory, threads, writes):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "feedback.db"
+        insert, finish = factory(path)
+        errors = []
+
+        def worker():
+            for _ in range(writes):
+                try:
+                    insert(*ROW)
+                except Exception as exc:
+                    errors.append(exc)
+
+        start = time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        finish()
+        elapsed = time.perf_counter() - start
+
+        conn = sql_lite.sqlite3.connect(path)
+        stored = conn.execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
+        conn.close()
+    total = threads * writes
+    print(f"{name:<20} {total / elapsed:>10,.0f} writes/s  stored={stored}/{total}  errors={len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=500, help="inserts per thread")
+    args = parser.parse_args()
+
+    run("connect-per-insert", connect_per_insert, args.threads, args.writes)
+    run("writer (direct)", lambda p: writer(p, buffered=False), args.threads, args.writes)
+    run("writer (buffered)", lambda p: writer(p, buffered=True), args.threads, args.writes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Sort-based vs bounded-heap flight ranking on synthetic candidate sets.
+
+    python benchmarks/bench_ranking.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ranking import TOP_FLIGHTS, merge_recommendations, rank_flights  # noqa: E402
+from recommender import FlightCandidate  # noqa: E402
+from routing import Route  # noqa: E402
+
+COMPARATORS = [
+    {"type": "hotel_award (example)", "value_per_mile_cents": 0.7},
+    {"type": "gift_card", "value_per_mile_cents": 0.5},
+]
+
+
+def make_candidates(n, seed, affordable_share):
+    rng = random.Random(seed)
+    candidates = []
+    for _ in range(n):
+        price = round(rng.uniform(49, 1800), 2)
+        route = Route(price, "USD", rng.random() < 0.4, "PT5H", ())
+        candidates.append(FlightCandidate(
+            route, "JFK", "LAX", "2025-09-01",
+            int(price * 75), round(rng.uniform(0.6, 2.4), 2), rng.random() < affordable_share,
+        ))
+    return candidates
+
+
+def sort_path(candidates):
+    # Ranking as it was done before ranking.py: filter, full sorts, re-sort with comparators
+    affordable = [f for f in candidates if f.affordable]
+    affordable.sort(key=lambda x: (-x.value_per_mile_cents, x.price_total))
+    top = (affordable or sorted(candidates, key=lambda x: (-x.value_per_mile_cents, x.price_total)))[:TOP_FLIGHTS]
+    recommendations = top + COMPARATORS
+    recommendations.sort(key=lambda x: -(x.value_per_mile_cents if isinstance(x, FlightCandidate) else x["value_per_mile_cents"]))
+    return top
+
+
+def heap_path(candidates):
+    top = rank_flights(candidates, TOP_FLIGHTS)
+    merge_recommendations([{"value_per_mile_cents": f.value_per_mile_cents} for f in top], COMPARATORS)
+    return top
+
+
+def timed(fn, candidates, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(candidates)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--affordable-share", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'candidates':>12} {'sort (ms)':>10} {'heap (ms)':>10} {'speedup':>8}")
+    for n in args.sizes:
+        candidates = make_candidates(n, args.seed, args.affordable_share)
+        sort_s, sort_top = timed(sort_path, candidates, args.repeat)
+        heap_s, heap_top = timed(heap_path, candidates, args.repeat)
+        assert [id(c) for c in sort_top] == [id(c) for c in heap_top]
+        print(f"{n:>12,} {sort_s * 1000:>10.1f} {heap_s * 1000:>10.1f} {sort_s / heap_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Offline benchmark suite: parsing, ranking, end-to-end /recommend throughput and
+search concurrency scaling, all against synthetic offers and a local stub
+Amadeus server, so no credentials or network are needed.
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --latency 0.1 --requests 400 --threads 8
+    python benchmarks/bench_suite.py --compare benchmarks/results/bench-20250901-120000.json
+
+Results are written as JSON (default benchmarks/results/bench-<timestamp>.json).
+With --compare, every metric is checked against an earlier run and changes worse
+than --tolerance are reported as regressions (exit status 1).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import generate_offers  # noqa: E402
+from benchmarks.stub_amadeus import StubAmadeus  # noqa: E402
+
+RESULTS_DIR = Path(ROOT) / "benchmarks" / "results"
+
+
+class Results:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, benchmark, params, metric, value, higher_is_better):
+        self.rows.append({"benchmark": benchmark, "params": params, "metric": metric,
+                          "value": round(value, 4), "higher_is_better": higher_is_better})
+        shown = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"  {benchmark:<22} {shown:<32} {metric:<16} {value:>14,.3f}")
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def bench_parse(results, sizes, segments, repeat):
+    from reference import iter_json_array
+    from routing import iter_routes, parse_routes
+
+    for n in sizes:
+        raw = json.dumps(generate_offers(n, segments)).encode("utf-8")
+        chunks = [raw[i:i + 65536] for i in range(0, len(raw), 65536)]
+        params = {"offers": n, "segments": segments}
+        full = best_of(lambda: parse_routes(json.loads(raw)), repeat)
+        streamed = best_of(lambda: list(iter_routes(iter_json_array(iter(chunks), "data"))), repeat)
+        results.add("parse.json_loads", params, "offers_per_s", n / full, True)
+        results.add("parse.streaming", params, "offers_per_s", n / streamed, True)
+
+
+def bench_rank(results, sizes, segments, repeat):
+    from ranking import TOP_FLIGHTS, rank_flights
+    from recommender import _flight_candidate
+    from routing import _annotate, parse_routes
+
+    for n in sizes:
+        payload = generate_offers(n, segments)
+        params = {"offers": n}
+        routes = parse_routes(payload)
+        annotate = best_of(lambda: [_annotate(r) for r in routes], repeat)
+        candidates = [_flight_candidate(r, 30000, "JFK", "LAX", "2025-09-01") for r in routes]
+        rank = best_of(lambda: rank_flights(candidates, TOP_FLIGHTS), repeat)
+        results.add("rank.annotate_vpm", params, "offers_per_s", n / annotate, True)
+        results.add("rank.top_k", params, "offers_per_s", n / rank, True)
+
+
+def bench_recommend(results, requests_total, threads):
+    import app as webapp
+
+    dates = [(date(2025, 9, 1) + timedelta(days=i % 300)).isoformat() for i in range(requests_total)]
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(slice_):
+        client = webapp.app.test_client()
+        for day in slice_:
+            start = time.perf_counter()
+            resp = client.get("/api/recommend", query_string={
+                "origin": "JFK", "destination": "LAX", "departure_date": day, "miles_available": 30000})
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if resp.status_code != 200:
+                    errors.append(resp.status_code)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(dates[i::threads],)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    params = {"threads": threads}
+    results.add("recommend.e2e", params, "requests_per_s", requests_total / elapsed, True)
+    results.add("recommend.e2e", params, "p50_ms", percentile(latencies, 0.50) * 1000, False)
+    results.add("recommend.e2e", params, "p95_ms", percentile(latencies, 0.95) * 1000, False)
+    results.add("recommend.e2e", params, "p99_ms", percentile(latencies, 0.99) * 1000, False)
+    results.add("recommend.e2e", params, "error_rate", len(errors) / requests_total, False)
+
+
+def bench_scaling(results, levels, flex_days):
+    from recommender import recommend_best_redemptions_async
+
+    for i, concurrency in enumerate(levels):
+        # A fresh month per level so no search is answered by an earlier one
+        day = (date(2026, 1, 15) + timedelta(days=40 * i)).isoformat()
+        start = time.perf_counter()
+        res = asyncio.run(recommend_best_redemptions_async(
+            "NYC", "LAX", day, 30000, flex_days=flex_days, concurrency=concurrency))
+        elapsed = time.perf_counter() - start
+        params = {"concurrency": concurrency, "searches": len(res["searches"])}
+        results.add("scaling.fan_out", params, "elapsed_ms", elapsed * 1000, False)
+
+
+def compare(rows, previous_path, tolerance):
+    previous = json.loads(Path(previous_path).read_text())
+    old = {(r["benchmark"], json.dumps(r["params"], sort_keys=True), r["metric"]): r for r in previous["results"]}
+    regressions = []
+    print(f"\ncompared with {previous_path}:")
+    for row in rows:
+        before = old.get((row["benchmark"], json.dumps(row["params"], sort_keys=True), row["metric"]))
+        if before is None or not before["value"]:
+            continue
+        change = (row["value"] - before["value"]) / before["value"]
+        worse = -change if row["higher_is_better"] else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        print(f"  {row['benchmark']:<22} {row['metric']:<16} {before['value']:>12,.3f} -> "
+              f"{row['value']:>12,.3f} ({change:+.1%}) {flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="offers per payload")
+    parser.add_argument("--segments", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests", type=int, default=200, help="end-to-end requests")
+    parser.add_argument("--threads", type=int, default=8, help="end-to-end client threads")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--flex-days", type=int, default=3)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["parse", "rank", "recommend", "scaling"])
+    parser.add_argument("--output", type=Path, help="results file (default: benchmarks/results/bench-<time>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    stub = StubAmadeus(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, segments=args.segments)
+    # Point the app at the stub and measure the uncached path; set before the app modules import
+    os.environ.update({
+        "AMADEUS_BASE_URL": stub.base_url, "AMADEUS_API_KEY": "bench", "AMADEUS_API_SECRET": "bench",
+        "OFFER_CACHE_TTL": "0", "OFFER_STORE_MAX_AGE": "0",
+    })
+    import sql_lite
+
+    results = Results()
+    with stub, tempfile.TemporaryDirectory() as tmp:
+        sql_lite._offer_store = sql_lite.OfferStore(Path(tmp) / "offers.db")
+        sql_lite._feedback_aggregates = sql_lite.FeedbackAggregates(Path(tmp) / "offers.db")
+        if "parse" not in args.skip:
+            print("parse")
+            bench_parse(results, args.sizes, args.segments, args.repeat)
+        if "rank" not in args.skip:
+            print("rank")
+            bench_rank(results, args.sizes, args.segments, args.repeat)
+        if "recommend" not in args.skip:
+            print("recommend")
+            bench_recommend(results, args.requests, args.threads)
+        if "scaling" not in args.skip:
+            print("scaling")
+            bench_scaling(results, args.concurrency, args.flex_days)
+        upstream = dict(stub.requests)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+            "stub_requests": upstream,
+        },
+        "results": results.rows,
+    }
+    output = args.output or RESULTS_DIR / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nresults written to {output}")
+
+    if args.compare and compare(results.rows, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
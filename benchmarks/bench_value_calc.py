@@ -0,0 +1,68 @@
+"""
+Scalar vs NumPy batch VPM scoring.
+
+    python benchmarks/bench_value_calc.py --offers 200000 --scenarios 4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from value_calc import (  # noqa: E402
+    miles_needed_for_value, value_per_mile,
+    miles_needed_for_value_batch, value_per_mile_batch,
+)
+
+
+def scalar_path(prices, taxes, cpms):
+    miles_out, vpm_out = [], []
+    for cpm in cpms:
+        for price, tax in zip(prices, taxes):
+            miles = miles_needed_for_value(price, cpm, tax)
+            miles_out.append(miles)
+            vpm_out.append(value_per_mile(price, miles, tax))
+    return miles_out, vpm_out
+
+
+def batch_path(prices, taxes, cpms):
+    miles = miles_needed_for_value_batch(prices[None, :], cpms[:, None], taxes[None, :])
+    return miles, value_per_mile_batch(prices[None, :], miles, taxes[None, :])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=200_000)
+    parser.add_argument("--scenarios", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    prices = [round(rng.uniform(49, 1800), 2) for _ in range(args.offers)]
+    taxes = [rng.choice([0.0, 5.60, 11.20, 89.40]) for _ in range(args.offers)]
+    cpms = [round(1.0 + 0.2 * i, 2) for i in range(args.scenarios)]
+
+    start = time.perf_counter()
+    scalar_miles, scalar_vpm = scalar_path(prices, taxes, cpms)
+    scalar_s = time.perf_counter() - start
+
+    prices_a, taxes_a, cpms_a = np.array(prices), np.array(taxes), np.array(cpms)
+    start = time.perf_counter()
+    batch_miles, batch_vpm = batch_path(prices_a, taxes_a, cpms_a)
+    batch_s = time.perf_counter() - start
+
+    assert batch_miles.ravel().tolist() == scalar_miles
+    assert batch_vpm.ravel().tolist() == scalar_vpm
+
+    rows = args.offers * args.scenarios
+    print(f"rows:   {rows:,} ({args.offers:,} offers x {args.scenarios} CPM scenarios)")
+    print(f"scalar: {scalar_s:.3f}s  ({rows / scalar_s:,.0f} rows/s)")
+    print(f"batch:  {batch_s:.3f}s  ({rows / batch_s:,.0f} rows/s)")
+    print(f"speedup: {scalar_s / batch_s:.1f}x (results identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Synthetic Amadeus flight-offer payloads for benchmarks.
+
+generate_offers() builds a search response shaped like the real
+/v2/shopping/flight-offers reply (meta, data and the trailing dictionaries
+block), with N offers of M segments each, cheapest first.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+CARRIERS = {
+    "AA": "AMERICAN AIRLINES", "DL": "DELTA AIR LINES", "UA": "UNITED AIRLINES", "AS": "ALASKA AIRLINES",
+    "B6": "JETBLUE AIRWAYS", "WN": "SOUTHWEST AIRLINES", "NK": "SPIRIT AIRLINES", "F9": "FRONTIER AIRLINES",
+}
+AIRCRAFT = {"321": "AIRBUS A321", "320": "AIRBUS A320", "738": "BOEING 737-800", "7M8": "BOEING 737 MAX 8",
+            "789": "BOEING 787-9", "E75": "EMBRAER 175"}
+HUBS = ["ORD", "DFW", "ATL", "DEN", "CLT", "PHX", "IAH", "MSP", "DTW", "SLC"]
+LOCATIONS = {
+    "JFK": ("NYC", "US"), "LGA": ("NYC", "US"), "EWR": ("NYC", "US"), "LAX": ("LAX", "US"),
+    "SFO": ("SFO", "US"), "SEA": ("SEA", "US"), "BOS": ("BOS", "US"), "MIA": ("MIA", "US"),
+    "ORD": ("CHI", "US"), "DFW": ("DFW", "US"), "ATL": ("ATL", "US"), "DEN": ("DEN", "US"),
+    "CLT": ("CLT", "US"), "PHX": ("PHX", "US"), "IAH": ("HOU", "US"), "MSP": ("MSP", "US"),
+    "DTW": ("DTT", "US"), "SLC": ("SLC", "US"), "SAN": ("SAN", "US"), "MSY": ("MSY", "US"),
+}
+
+
+def _iso_duration(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return f"PT{hours}H{minutes}M" if minutes else f"PT{hours}H"
+
+
+def generate_offer(rng: random.Random, offer_id: int, origin: str, destination: str, departure_date: str,
+                   segments: int, price: float) -> Dict:
+    carrier = rng.choice(list(CARRIERS))
+    stops = [origin] + rng.sample(HUBS, min(segments - 1, len(HUBS))) + [destination]
+    at = datetime.fromisoformat(departure_date) + timedelta(hours=rng.randint(6, 20), minutes=rng.choice([0, 15, 30, 45]))
+    first_departure = at
+    segs, fare_details = [], []
+    for i in range(len(stops) - 1):
+        flight_minutes = rng.randint(55, 330)
+        arrival = at + timedelta(minutes=flight_minutes)
+        segment_id = f"{offer_id}-{i + 1}"
+        segs.append({
+            "departure": {"iataCode": stops[i], "terminal": str(rng.randint(1, 8)), "at": at.isoformat()},
+            "arrival": {"iataCode": stops[i + 1], "at": arrival.isoformat()},
+            "carrierCode": carrier,
+            "number": str(rng.randint(10, 2999)),
+            "aircraft": {"code": rng.choice(list(AIRCRAFT))},
+            "operating": {"carrierCode": carrier},
+            "duration": _iso_duration(flight_minutes),
+            "id": segment_id,
+            "numberOfStops": 0,
+            "blacklistedInEU": False,
+        })
+        fare_details.append({
+            "segmentId": segment_id,
+            "cabin": "ECONOMY",
+            "fareBasis": f"{rng.choice('KLMQSVY')}A{rng.randint(0, 21):02d}AKEN",
+            "class": rng.choice("KLMQSVY"),
+            "includedCheckedBags": {"quantity": rng.choice([0, 0, 1])},
+        })
+        at = arrival + timedelta(minutes=rng.randint(45, 180))
+    total = f"{price:.2f}"
+    base = f"{price * 0.86:.2f}"
+    return {
+        "type": "flight-offer",
+        "id": str(offer_id),
+        "source": "GDS",
+        "instantTicketingRequired": False,
+        "nonHomogeneous": False,
+        "oneWay": False,
+        "lastTicketingDate": departure_date,
+        "numberOfBookableSeats": rng.randint(1, 9),
+        "itineraries": [{
+            "duration": _iso_duration(int((arrival - first_departure).total_seconds() // 60)),
+            "segments": segs,
+        }],
+        "price": {
+            "currency": "USD", "total": total, "base": base,
+            "fees": [{"amount": "0.00", "type": "SUPPLIER"}, {"amount": "0.00", "type": "TICKETING"}],
+            "grandTotal": total,
+        },
+        "pricingOptions": {"fareType": ["PUBLISHED"], "includedCheckedBagsOnly": True},
+        "validatingAirlineCodes": [carrier],
+        "travelerPricings": [{
+            "travelerId": "1", "fareOption": "STANDARD", "travelerType": "ADULT",
+            "price": {"currency": "USD", "total": total, "base": base},
+            "fareDetailsBySegment": fare_details,
+        }],
+    }
+
+
+def generate_offers(n: int, segments: int = 2, origin: str = "JFK", destination: str = "LAX",
+                    departure_date: str = "2025-09-01", seed: Optional[int] = 7) -> Dict:
+    """
+    A full search response with `n` offers of `segments` segments each, cheapest first.
+    """
+    rng = random.Random(seed)
+    prices = sorted(round(rng.uniform(79, 1400), 2) for _ in range(n))
+    data: List[Dict] = [
+        generate_offer(rng, i + 1, origin, destination, departure_date, max(segments, 1), price)
+        for i, price in enumerate(prices)
+    ]
+    codes = {origin, destination} | {s["arrival"]["iataCode"] for o in data for s in o["itineraries"][0]["segments"]}
+    return {
+        "meta": {"count": n, "links": {"self": "https://test.api.amadeus.com/v2/shopping/flight-offers"
+                                               f"?originLocationCode={origin}&destinationLocationCode={destination}"
+                                               f"&departureDate={departure_date}&adults=1&max={n}"}},
+        "data": data,
+        "dictionaries": {
+            "locations": {c: {"cityCode": LOCATIONS.get(c, (c, "US"))[0], "countryCode": LOCATIONS.get(c, (c, "US"))[1]}
+                          for c in sorted(codes)},
+            "aircraft": dict(AIRCRAFT),
+            "currencies": {"USD": "US DOLLAR"},
+            "carriers": dict(CARRIERS),
+        },
+    }
@@ -0,0 +1,183 @@
+"""
+Local stand-in for the Amadeus token, flight-offers and pricing endpoints.
+
+    python benchmarks/stub_amadeus.py --port 8099 --latency 0.08 --error-rate 0.02
+    AMADEUS_BASE_URL=http://127.0.0.1:8099 AMADEUS_API_KEY=x AMADEUS_API_SECRET=y python app.py
+
+Searches answer with fixtures.generate_offers() (seeded by the query, so the same
+search always returns the same offers). Pricing echoes the offers back with
+per-traveler taxes added. Every response is delayed by `latency` seconds (plus up
+to `jitter`), and a share `error_rate` of requests fail with `error_status`.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_offers  # noqa: E402
+
+TOKEN_PATH = "/v1/security/oauth2/token"
+OFFERS_PATH = "/v2/shopping/flight-offers"
+PRICING_PATH = "/v1/shopping/flight-offers/pricing"
+
+
+def priced(offer: dict) -> dict:
+    """
+    The offer as the pricing endpoint returns it: totals confirmed, taxes itemised.
+    """
+    offer = json.loads(json.dumps(offer))
+    base = float(offer["price"]["base"])
+    total = float(offer["price"]["total"])
+    taxes = [{"amount": "5.60", "code": "AY"}, {"amount": f"{max(total - base - 5.60, 0.0):.2f}", "code": "US"}]
+    for traveler in offer.get("travelerPricings", []):
+        traveler["price"]["taxes"] = taxes
+    return offer
+
+
+class StubAmadeus:
+    """
+    Threaded HTTP server speaking enough of the Amadeus API for the client.
+    Use as a context manager; `base_url` is what AMADEUS_BASE_URL should be set to.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, segments: int = 2, seed: int = 7):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.segments = segments
+        self.seed = seed
+        self.requests = {"token": 0, "offers": 0, "pricing": 0, "errors": 0}
+        # Optional fn(priced_offers) -> priced_offers, e.g. to reorder or drop offers like Amadeus may
+        self.pricing_hook: Optional[Callable[[List[dict]], List[dict]]] = None
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubAmadeus":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-amadeus", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubAmadeus":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _delay_and_fail(self, kind: str) -> bool:
+        with self._lock:
+            self.requests[kind] += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.requests["errors"] += 1
+        if delay:
+            time.sleep(delay)
+        return failed
+
+    def search(self, query: dict) -> dict:
+        origin = query.get("originLocationCode", ["JFK"])[0]
+        destination = query.get("destinationLocationCode", ["LAX"])[0]
+        departure_date = query.get("departureDate", ["2025-09-01"])[0]
+        count = int(query.get("max", ["10"])[0])
+        seed = zlib.crc32(f"{self.seed}|{origin}|{destination}|{departure_date}".encode())
+        return generate_offers(count, self.segments, origin, destination, departure_date, seed=seed)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/vnd.amadeus+json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def _error(self) -> None:
+                self._send(stub.error_status, {"errors": [{"status": stub.error_status, "title": "STUB ERROR"}]})
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._body()
+                if path == TOKEN_PATH:
+                    if stub._delay_and_fail("token"):
+                        return self._error()
+                    return self._send(200, {"type": "amadeusOAuth2Token", "access_token": "stub-token",
+                                            "token_type": "Bearer", "expires_in": 1799, "state": "approved"})
+                if path == PRICING_PATH:
+                    if stub._delay_and_fail("pricing"):
+                        return self._error()
+                    offers = [priced(o) for o in json.loads(body or b"{}").get("data", {}).get("flightOffers", [])]
+                    if stub.pricing_hook is not None:
+                        offers = stub.pricing_hook(offers)
+                    return self._send(200, {"data": {"type": "flight-offers-pricing", "flightOffers": offers}})
+                self._send(404, {"errors": [{"status": 404, "title": "NOT FOUND"}]})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != OFFERS_PATH:
+                    return self._send(404, {"errors": [{"status": 404, "title": "NOT FOUND"}]})
+                if self.headers.get("Authorization") != "Bearer stub-token":
+                    return self._send(401, {"errors": [{"status": 401, "title": "Invalid access token"}]})
+                if stub._delay_and_fail("offers"):
+                    return self._error()
+                self._send(200, stub.search(parse_qs(url.query)))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.02, help="extra random delay, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--segments", type=int, default=2, help="segments per offer")
+    args = parser.parse_args()
+
+    stub = StubAmadeus(args.host, args.port, args.latency, args.jitter, args.error_rate, args.error_status, args.segments)
+    print(f"stub Amadeus listening on {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
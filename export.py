@@ -0,0 +1,159 @@
+"""
+Streaming itinerary export: raw offers -> simplified segments -> routes -> text, CSV or NDJSON.
+
+    python export.py --format csv --output report.csv
+    python export.py --format text --origin JFK --destination LAX --since-hours 24
+
+Every stage is a generator, so memory stays flat however many offers are
+exported. Writers emit one chunk per route; iter_export() joins them into
+writes of about CHUNK_SIZE characters for files and HTTP responses.
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, TextIO
+
+from reference import iso_to_readable, iter_simplified_offers
+from sql_lite import DB_PATH, OfferStore
+
+EXPORT_FORMATS = ("text", "csv", "ndjson")
+MIMETYPES = {
+    "text": "text/plain; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+CSV_COLUMNS = ("route", "segment", "segments", "flight_code", "airline_code", "departure_airport",
+               "departure_time", "arrival_airport", "arrival_time", "price")
+
+# Characters buffered per write
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_route_groups(flights: Iterable[Dict]) -> Iterator[List[Dict]]:
+    """
+    Groups simplified segments into routes: a segment departing from the previous
+    segment's arrival airport continues the route, anything else starts a new one.
+    """
+    route: List[Dict] = []
+    for flight in flights:
+        if route and route[-1]["arrival_airport"] != flight["departure_airport"]:
+            yield route
+            route = []
+        route.append(flight)
+    if route:
+        yield route
+
+
+def iter_text(routes: Iterable[List[Dict]]) -> Iterator[str]:
+    """
+    The simplify_data report, one route at a time.
+    """
+    for route_num, route in enumerate(routes, start=1):
+        if len(route) > 1:
+            parts = [f"Route {route_num}: Connecting flight with {len(route)} segments\n\n"]
+        else:
+            parts = [f"Route {route_num}: Direct flight\n\n"]
+        for i, flight in enumerate(route, start=1):
+            departure_airport = flight.get("departure_airport")
+            arrival_airport = flight.get("arrival_airport")
+            parts.append(
+                f"  Segment {i}: {departure_airport} --> {arrival_airport}\n"
+                f"    Flight Code: {flight.get('flight_code')}\n"
+                f"    Airline Code: {flight.get('airline_code')}\n"
+                f"    Departure: {iso_to_readable(flight.get('departure_time'))} from {departure_airport}\n"
+                f"    Arrival:   {iso_to_readable(flight.get('arrival_time'))} at {arrival_airport}\n"
+                f"    Price:     {flight.get('price')}\n\n"
+            )
+        yield "".join(parts)
+
+
+def iter_csv(routes: Iterable[List[Dict]]) -> Iterator[str]:
+    """
+    One CSV row per segment (ISO timestamps), after a header row.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    for route_num, route in enumerate(routes, start=1):
+        writer.writerows(
+            (route_num, i, len(route), f.get("flight_code"), f.get("airline_code"), f.get("departure_airport"),
+             f.get("departure_time"), f.get("arrival_airport"), f.get("arrival_time"), f.get("price"))
+            for i, f in enumerate(route, start=1)
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def iter_ndjson(routes: Iterable[List[Dict]]) -> Iterator[str]:
+    """
+    One JSON object per route: {"route": n, "segments": [...]}.
+    """
+    for route_num, route in enumerate(routes, start=1):
+        yield json.dumps({"route": route_num, "segments": route}, separators=(",", ":")) + "\n"
+
+
+WRITERS = {"text": iter_text, "csv": iter_csv, "ndjson": iter_ndjson}
+
+
+def _batched(chunks: Iterable[str], size: int) -> Iterator[str]:
+    buf: List[str] = []
+    buffered = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield "".join(buf)
+            buf, buffered = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+def iter_export(offers: Iterable[Dict], fmt: str = "text", chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Raw Amadeus offers rendered as `fmt` (one of EXPORT_FORMATS), in chunks of
+    about `chunk_size` characters. Offers are read lazily as chunks are consumed.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown export format {fmt!r}; choose one of {', '.join(EXPORT_FORMATS)}")
+    return _batched(WRITERS[fmt](iter_route_groups(iter_simplified_offers(offers))), chunk_size)
+
+
+def write_export(offers: Iterable[Dict], fp: TextIO, fmt: str = "text", chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Streams the export to an open text file. Returns the number of characters written.
+    Open CSV targets with newline="" so row endings are kept as written.
+    """
+    written = 0
+    for chunk in iter_export(offers, fmt, chunk_size):
+        written += fp.write(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="text")
+    parser.add_argument("--output", type=Path, help="output file (default: stdout)")
+    parser.add_argument("--origin")
+    parser.add_argument("--destination")
+    parser.add_argument("--departure-date")
+    parser.add_argument("--since-hours", type=float, help="only offers fetched in the last N hours")
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    args = parser.parse_args()
+
+    since = time.time() - args.since_hours * 3600 if args.since_hours is not None else None
+    offers = OfferStore(args.db).iter_offers(args.origin, args.destination, args.departure_date, since)
+    if args.output is None:
+        write_export(offers, sys.stdout, args.format)
+        return
+    with open(args.output, "w", encoding="utf-8", newline="") as fp:
+        written = write_export(offers, fp, args.format)
+    print(f"wrote {written:,} characters to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
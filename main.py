@@ -1,9 +1,29 @@
-from reference import *
+"""
+Bulk flight-offer ingestion into the SQLite offer store.
 
+    python main.py --routes routes.csv --start 2025-09-01 --end 2025-09-14 --workers 4 --rate 10
 
+The route file has one `ORIGIN,DESTINATION[,name]` per line (# starts a comment).
+Completed searches are recorded in a checkpoint file so an interrupted run can
+be resumed by re-running the same command.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
 
-#Extracting flight route data
-routes = [
+from reference import AmadeusClient, TokenBucket
+from sql_lite import DB_PATH, OfferStore
+
+# Routes crawled when no route file is given
+DEFAULT_ROUTES = [
     ("JFK", "ORD", "NYC to Chicago"),
     ("SAN", "DFW", "San Diego to Dallas"),
     ("MIA", "CLT", "Miami to Charlotte"),
@@ -11,12 +31,175 @@ routes = [
     ("BOS", "MSY", "Boston to New Orleans")
 ]
 
-for route in routes:
-    for i in range(1, 3):
-        if i < 10:
-            day = "0" + str(i)
-        else:
-            day = i
-        offers = simplify_offers(search_flights(route[0], route[1], f"2025-09-{day}", 1, 5))
+# Amadeus self-service test quota is 10 transactions/second
+DEFAULT_RATE = 10.0
+
+
+def load_routes(path: Path) -> List[Tuple[str, str, str]]:
+    """
+    Reads the route file; lines without both an origin and a destination are
+    reported on stderr and skipped.
+    """
+    routes = []
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if not any(cell.strip() for cell in row) or row[0].strip().startswith("#"):
+                continue
+            if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                print(f"{path}:{reader.line_num}: skipping malformed route {','.join(row)!r}", file=sys.stderr)
+                continue
+            origin, destination = row[0].strip().upper(), row[1].strip().upper()
+            name = row[2].strip() if len(row) > 2 else f"{origin} to {destination}"
+            routes.append((origin, destination, name))
+    return routes
+
+
+def date_range(start: str, end: str) -> List[str]:
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+def search_key(origin: str, destination: str, departure_date: str, adults: int) -> str:
+    return f"{origin}|{destination}|{departure_date}|{adults}"
+
+
+def load_checkpoint(path: Path) -> Set[str]:
+    """
+    Completed search keys from the checkpoint log (one key per line), compacting the
+    log to one line per key. A torn last line from a crash is ignored; checkpoints in
+    the older JSON format are read and rewritten as a log.
+    """
+    if not path.exists():
+        return set()
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        completed = set(json.loads(text).get("completed", []))
+    else:
+        lines = text.split("\n")
+        if not text.endswith("\n"):
+            lines.pop()  # torn write
+        completed = {line for line in lines if line}
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        f.writelines(f"{key}\n" for key in sorted(completed))
+    os.replace(tmp, path)
+    return completed
+
+
+def append_checkpoint(path: Path, keys: Iterable[str]) -> None:
+    # Appending keeps each flush proportional to its batch, not to the whole run
+    with open(path, "a") as f:
+        f.writelines(f"{key}\n" for key in keys)
+
+
+def ingest(client: AmadeusClient, store: OfferStore, searches: List[Tuple[str, str, str]], adults: int,
+           max_results: int, workers: int, batch_size: int, checkpoint: Path) -> Dict:
+    """
+    Runs the searches on a bounded worker pool and writes results to the store in
+    batches. At most `2 * workers` searches are submitted at a time, so memory does
+    not grow with the number of routes and dates. Failed searches are reported and
+    left out of the checkpoint so the next run retries them. On Ctrl-C, queued
+    searches are cancelled, finished ones are written and checkpointed, and the
+    report is returned with `interrupted` set.
+    """
+    completed = load_checkpoint(checkpoint)
+    pending = [s for s in searches if search_key(*s, adults) not in completed]
+    report = {"planned": len(searches), "skipped": len(searches) - len(pending),
+              "searched": 0, "failed": 0, "rows": 0, "errors": [], "interrupted": False}
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        report["rows"] += store.save_searches(batch)
+        append_checkpoint(checkpoint, [search_key(o, d, day, adults) for o, d, day, _, _ in batch])
+        batch.clear()
+
+    start = time.perf_counter()
+    max_in_flight = 2 * workers
+    queue = iter(pending)
+    in_flight = {}
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            for o, d, day in islice(queue, max_in_flight - len(in_flight)):
+                in_flight[pool.submit(client.search_flights, o, d, day, adults, max_results)] = (o, d, day)
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                origin, destination, departure_date = in_flight.pop(future)
+                try:
+                    offers = future.result()
+                except Exception as exc:
+                    report["failed"] += 1
+                    report["errors"].append(f"{origin}-{destination} {departure_date}: {exc}")
+                    continue
+                report["searched"] += 1
+                batch.append((origin, destination, departure_date, adults, offers.get("data", [])))
+                if len(batch) >= batch_size:
+                    flush()
+    except KeyboardInterrupt:
+        report["interrupted"] = True
+    finally:
+        # Don't wait on searches still in flight after Ctrl-C; the next run retries them
+        pool.shutdown(wait=not report["interrupted"], cancel_futures=True)
+        flush()
+
+    elapsed = time.perf_counter() - start
+    report["elapsed_s"] = round(elapsed, 2)
+    report["searches_per_s"] = round(report["searched"] / elapsed, 2) if elapsed else 0.0
+    report["rows_per_s"] = round(report["rows"] / elapsed, 2) if elapsed else 0.0
+    report["client"] = client.stats()
+    return report
+
+
+def positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", type=Path, help="route file (default: built-in route list)")
+    parser.add_argument("--start", default=date.today().isoformat(), help="first departure date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last departure date (default: same as --start)")
+    parser.add_argument("--adults", type=int, default=1)
+    parser.add_argument("--max-results", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=positive_float, default=DEFAULT_RATE, help="max requests per second")
+    parser.add_argument("--burst", type=positive_float, default=None, help="token bucket size (default: --rate)")
+    parser.add_argument("--batch-size", type=int, default=25, help="searches per database write")
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    parser.add_argument("--checkpoint", type=Path, default=Path("ingest_checkpoint.log"))
+    args = parser.parse_args()
+
+    routes = load_routes(args.routes) if args.routes else DEFAULT_ROUTES
+    days = date_range(args.start, args.end or args.start)
+    searches = [(origin, destination, day) for origin, destination, _ in routes for day in days]
+
+    client = AmadeusClient(pool_size=args.workers, rate_limiter=TokenBucket(args.rate, args.burst))
+    try:
+        report = ingest(client, OfferStore(args.db), searches, args.adults, args.max_results,
+                        args.workers, args.batch_size, args.checkpoint)
+    finally:
+        client.close()
+
+    if report["interrupted"]:
+        print("interrupted: finished searches were saved; re-run the same command to resume")
+    print(f"searches: {report['searched']} ok, {report['failed']} failed, "
+          f"{report['skipped']} skipped (checkpoint) of {report['planned']}")
+    print(f"rows:     {report['rows']}")
+    print(f"elapsed:  {report['elapsed_s']}s  "
+          f"({report['searches_per_s']} searches/s, {report['rows_per_s']} rows/s)")
+    print(f"client:   {report['client']}")
+    for error in report["errors"][:10]:
+        print(f"  failed: {error}")
+
 
-        # save_flights_to_db(offers, routes[3])
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Defaults for the flight-offer search cache (overridable via environment)
+OFFER_CACHE_TTL = float(os.getenv("OFFER_CACHE_TTL", "300"))
+OFFER_CACHE_STALE_TTL = float(os.getenv("OFFER_CACHE_STALE_TTL", "0"))
+OFFER_CACHE_MAXSIZE = int(os.getenv("OFFER_CACHE_MAXSIZE", "1024"))
+OFFER_CACHE_BACKEND = os.getenv("OFFER_CACHE_BACKEND", "memory")
+OFFER_CACHE_PATH = Path(os.getenv("OFFER_CACHE_PATH", "offer_cache.db"))
+
+
+class MemoryBackend:
+    """
+    In-process LRU store. Entries are (stored_at, value) tuples.
+    """
+
+    def __init__(self, maxsize: int = OFFER_CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, stored_at: float, value: Any) -> int:
+        """
+        Stores an entry and returns how many entries were evicted to make room.
+        """
+        evicted = 0
+        with self._lock:
+            self._data[key] = (stored_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    SQLite-file store so every gunicorn worker on a host shares one cache.
+    Values are stored as JSON; LRU order is tracked with `accessed_at`.
+    """
+
+    def __init__(self, path: Path = OFFER_CACHE_PATH, maxsize: int = OFFER_CACHE_MAXSIZE):
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS offer_cache (
+                key TEXT PRIMARY KEY,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                value TEXT NOT NULL
+            )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_offer_cache_accessed ON offer_cache (accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT stored_at, value FROM offer_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE offer_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, stored_at: float, value: Any) -> int:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO offer_cache (key, stored_at, accessed_at, value) VALUES (?, ?, ?, ?)",
+                (key, stored_at, time.time(), json.dumps(value)),
+            )
+            cur = conn.execute(
+                """
+            DELETE FROM offer_cache WHERE key IN (
+                SELECT key FROM offer_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+                """,
+                (self.maxsize,),
+            )
+        return max(cur.rowcount, 0)
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM offer_cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM offer_cache")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM offer_cache").fetchone()[0]
+
+
+class TTLCache:
+    """
+    Time-bounded cache over a pluggable backend.
+
+    Entries younger than `ttl` are served as hits. With `stale_ttl` > 0,
+    entries up to `ttl + stale_ttl` old are served immediately while a
+    background thread reloads them (stale-while-revalidate). A `ttl` of 0
+    disables caching entirely.
+    """
+
+    def __init__(self, backend=None, ttl: float = OFFER_CACHE_TTL, stale_ttl: float = OFFER_CACHE_STALE_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def get_or_load(self, key: str, loader: Callable[[], Any],
+                    stamp: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+        """
+        The cached value for `key`, loading and storing it on a miss. `stamp` maps a
+        loaded value to the time its data was fetched (None for "now"), so data that
+        was already old when loaded does not get a fresh TTL.
+        """
+        if self.ttl <= 0:
+            return loader()
+        entry = self.backend.get(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < self.ttl:
+                self._count("hits")
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._refresh_in_background(key, loader, stamp)
+                return entry[1]
+        self._count("misses")
+        value = loader()
+        self.put(key, value, stamp(value) if stamp else None)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        The cached value for `key` if it is younger than `ttl`, else `default`. Never loads.
+        """
+        if self.ttl <= 0:
+            return default
+        entry = self.backend.get(key)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            self._count("misses")
+            return default
+        self._count("hits")
+        return entry[1]
+
+    def get_stale(self, key: str) -> Any:
+        """
+        The cached value for `key` however old it is (None if evicted); a fallback when
+        the loader is failing.
+        """
+        entry = self.backend.get(key)
+        return entry[1] if entry is not None else None
+
+    def put(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        evicted = self.backend.set(key, time.time() if stored_at is None else stored_at, value)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Any],
+                               stamp: Optional[Callable[[Any], Optional[float]]] = None) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                value = loader()
+                self.put(key, value, stamp(value) if stamp else None)
+                self._count("refreshes")
+            except Exception:
+                # Keep serving the stale entry; the next request past stale_ttl reloads synchronously
+                self._count("refresh_errors")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="offer-cache-refresh", daemon=True).start()
+
+    def stored_at(self, key: str) -> Optional[float]:
+        """
+        When the entry for `key` was stored, or None if it is missing or past its TTL.
+        Changes whenever the cached value is replaced, so it works as a version stamp.
+        """
+        if self.ttl <= 0:
+            return None
+        entry = self.backend.get(key)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            return None
+        return entry[0]
+
+    def invalidate(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        stats["size"] = len(self.backend)
+        stats["ttl"] = self.ttl
+        stats["stale_ttl"] = self.stale_ttl
+        return stats
+
+
+def search_cache_key(origin: str, destination: str, departure_date: str, adults: int, max_results: int) -> str:
+    return f"{origin}|{destination}|{departure_date}|{adults}|{max_results}"
+
+
+def build_offer_cache() -> TTLCache:
+    """
+    Builds the flight-offer search cache from the OFFER_CACHE_* settings.
+    """
+    if OFFER_CACHE_BACKEND == "sqlite":
+        backend = SQLiteBackend(OFFER_CACHE_PATH, OFFER_CACHE_MAXSIZE)
+    else:
+        backend = MemoryBackend(OFFER_CACHE_MAXSIZE)
+    return TTLCache(backend, ttl=OFFER_CACHE_TTL, stale_ttl=OFFER_CACHE_STALE_TTL)
@@ -0,0 +1,149 @@
+import asyncio
+import os
+from concurrent import futures
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import REGISTRY, stats_collector
+from offer_cache import MemoryBackend, TTLCache
+from reference import PRICING_BATCH_SIZE, AsyncAmadeusClient, get_async_client
+from routing import Route, route_fingerprint
+
+# Batch price confirmation for the top recommendations (overridable via environment)
+PRICING_TOP_K = int(os.getenv("PRICING_TOP_K", "5"))
+PRICING_DEADLINE = float(os.getenv("PRICING_DEADLINE", "3"))
+PRICING_CACHE_TTL = float(os.getenv("PRICING_CACHE_TTL", "120"))
+PRICING_CACHE_MAXSIZE = int(os.getenv("PRICING_CACHE_MAXSIZE", "4096"))
+
+# Confirmed {"price_total", "taxes_usd"} per offer fingerprint
+priced_offers = TTLCache(MemoryBackend(PRICING_CACHE_MAXSIZE), ttl=PRICING_CACHE_TTL)
+
+PRICING_BATCHES = REGISTRY.counter("pricing_batches_total", "Pricing calls by outcome.", ["outcome"])
+REGISTRY.add_collector(stats_collector("priced_offers", priced_offers.stats, "Confirmed-price cache"))
+
+
+def pricing_key(r: Route) -> str:
+    return repr(route_fingerprint(r))
+
+
+def offer_taxes(priced_offer: Dict) -> float:
+    """
+    Taxes on a priced offer: the itemised traveler taxes when present, else total minus base fare.
+    """
+    taxes = [
+        float(tax.get("amount", 0.0))
+        for traveler in priced_offer.get("travelerPricings", [])
+        for tax in traveler.get("price", {}).get("taxes", [])
+    ]
+    if taxes:
+        return round(sum(taxes), 2)
+    price = priced_offer.get("price", {})
+    try:
+        return round(max(float(price["total"]) - float(price["base"]), 0.0), 2)
+    except (KeyError, ValueError, TypeError):
+        return 0.0
+
+
+def confirmed_price(priced_offer: Dict) -> Dict:
+    price = priced_offer.get("price", {})
+    return {
+        "price_total": float(price.get("grandTotal") or price.get("total") or 0.0),
+        "taxes_usd": offer_taxes(priced_offer),
+    }
+
+
+def _price_batch(client, batch: List[Tuple[str, Route]]) -> Dict[str, Dict]:
+    """
+    One pricing call for up to PRICING_BATCH_SIZE routes; results are cached as soon
+    as they arrive, so a call that finishes after the deadline still helps the next view.
+
+    A batch can mix offers from several searches, each numbering its offers from "1",
+    so every offer is sent under an id unique to the batch and priced offers are
+    matched back by that id. Offers Amadeus leaves out of the reply stay unconfirmed.
+    """
+    keys = {}
+    offers = []
+    for n, (key, r) in enumerate(batch, 1):
+        keys[str(n)] = key
+        offers.append(dict(r.offer, id=str(n)))
+    try:
+        priced = client.confirm_offer_prices(offers)
+    except Exception:
+        PRICING_BATCHES.inc("error")
+        raise
+    PRICING_BATCHES.inc("ok")
+    confirmed = {}
+    for offer in priced:
+        key = keys.pop(str(offer.get("id")), None)
+        if key is None:
+            continue
+        confirmed[key] = confirmed_price(offer)
+        priced_offers.put(key, confirmed[key])
+    return confirmed
+
+
+def _start_pricing(routes: Sequence[Route], client: Optional[AsyncAmadeusClient]):
+    """
+    Splits routes into cached prices and submitted pricing batches.
+    Routes without a raw offer (mock data) are skipped.
+    """
+    confirmed: Dict[str, Dict] = {}
+    pending: Dict[str, Route] = {}
+    for r in routes:
+        if r.offer is None:
+            continue
+        key = pricing_key(r)
+        if key in confirmed or key in pending:
+            continue
+        cached = priced_offers.get(key)
+        if cached is not None:
+            confirmed[key] = cached
+        else:
+            pending[key] = r
+    if not pending:
+        return confirmed, []
+    client = client or get_async_client()
+    items = list(pending.items())
+    jobs = [
+        client.executor.submit(_price_batch, client.client, items[i:i + PRICING_BATCH_SIZE])
+        for i in range(0, len(items), PRICING_BATCH_SIZE)
+    ]
+    return confirmed, jobs
+
+
+def _collect(confirmed: Dict[str, Dict], done) -> Dict[str, Dict]:
+    for job in done:
+        if not job.cancelled() and job.exception() is None:
+            confirmed.update(job.result())
+    return confirmed
+
+
+def confirm_prices(routes: Sequence[Route], deadline: float = PRICING_DEADLINE,
+                   client: Optional[AsyncAmadeusClient] = None) -> Dict[str, Dict]:
+    """
+    Confirmed price and taxes for each route, keyed by pricing_key. Uncached routes are
+    priced in batches of PRICING_BATCH_SIZE on the upstream worker pool; routes whose
+    batch fails or misses the deadline are left out.
+    """
+    confirmed, jobs = _start_pricing(routes, client)
+    if jobs:
+        done, late = futures.wait(jobs, timeout=deadline)
+        for job in late:
+            job.cancel()
+        _collect(confirmed, done)
+    return confirmed
+
+
+async def confirm_prices_async(routes: Sequence[Route], deadline: float = PRICING_DEADLINE,
+                               client: Optional[AsyncAmadeusClient] = None) -> Dict[str, Dict]:
+    """
+    Awaitable confirm_prices.
+    """
+    confirmed, jobs = _start_pricing(routes, client)
+    if jobs:
+        waiting = {asyncio.wrap_future(job): job for job in jobs}
+        done, late = await asyncio.wait(waiting, timeout=deadline)
+        for w in late:
+            # Batches already running finish and fill the cache; queued ones are dropped
+            w.cancel()
+        _collect(confirmed, [waiting[w] for w in done])
+    return confirmed
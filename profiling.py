@@ -0,0 +1,108 @@
+"""
+Opt-in per-request profiling.
+
+With PROFILE_ENABLED=1, a request carrying an `X-Profile` header is profiled and the
+report is written to PROFILE_DIR; the response names the file in `X-Profile-File`.
+
+    X-Profile: sample    # stack sampler over every thread (sees the search worker pool)
+    X-Profile: cprofile  # deterministic cProfile of the request thread only
+
+When disabled the only per-request cost is one header lookup.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.002"))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads every `interval` seconds from a daemon thread.
+    The report is in collapsed-stack format (`frame;frame;frame count`), which
+    flamegraph tools read directly.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = ";".join(f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})"
+                                 for f in traceback.extract_stack(frame))
+                self._stacks[stack] += 1
+            self.samples += 1
+
+    def report(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+        return "\n".join(lines) + "\n"
+
+
+class CProfiler:
+    """
+    cProfile of the calling thread, reported as pstats sorted by cumulative time.
+    """
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def report(self) -> str:
+        out = io.StringIO()
+        pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(60)
+        return out.getvalue()
+
+
+def start_profile(mode: str):
+    """
+    Starts a profiler for the given X-Profile header value.
+    """
+    profiler = CProfiler() if mode.strip().lower() == "cprofile" else SamplingProfiler()
+    profiler.start()
+    return profiler
+
+
+def finish_profile(profiler, label: str) -> Path:
+    """
+    Stops the profiler and writes its report; returns the report path.
+    """
+    profiler.stop()
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    kind = "prof" if isinstance(profiler, CProfiler) else "folded"
+    path = PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}.{kind}.txt"
+    path.write_text(profiler.report())
+    return path
@@ -0,0 +1,51 @@
+import heapq
+from typing import Dict, Iterable, List, Sequence
+
+# Number of flights shown in the recommendations
+TOP_FLIGHTS = 5
+
+
+def rank_flights(candidates: Iterable, k: int = TOP_FLIGHTS) -> List:
+    """
+    Single pass over flight candidates keeping two bounded heaps: the best `k`
+    the user can afford and the best `k` overall. Returns the affordable picks,
+    or the overall picks when nothing is affordable, ordered by value-per-mile
+    (desc), then route rating (desc), then price (asc), then input order.
+
+    Candidates need `affordable`, `value_per_mile_cents`, `route_rating` and
+    `price_total` attributes.
+    """
+    if k <= 0:
+        return []
+    # Min-heaps on the inverted sort key, so heap[0] is the worst pick kept so far.
+    # Most candidates lose on value alone, so compare that before building an entry.
+    affordable: List = []
+    overall: List = []
+    for seq, c in enumerate(candidates):
+        vpm = c.value_per_mile_cents
+        if len(overall) < k or vpm >= overall[0][0]:
+            entry = (vpm, c.route_rating, -c.price_total, -seq, c)
+            _push_bounded(overall, entry, k)
+            if c.affordable:
+                _push_bounded(affordable, entry, k)
+        elif c.affordable and (len(affordable) < k or vpm >= affordable[0][0]):
+            _push_bounded(affordable, (vpm, c.route_rating, -c.price_total, -seq, c), k)
+    best = affordable or overall
+    return [entry[-1] for entry in sorted(best, reverse=True)]
+
+
+def _push_bounded(heap: List, entry, k: int) -> None:
+    if len(heap) < k:
+        heapq.heappush(heap, entry)
+    elif entry[:4] > heap[0][:4]:
+        heapq.heapreplace(heap, entry)
+
+
+def merge_recommendations(flights: Sequence[Dict], comparators: Iterable[Dict]) -> List[Dict]:
+    """
+    Merges ranked flight dicts with the hotel/gift-card comparators by
+    value_per_mile_cents (desc). On equal value, flights come first, matching a
+    stable sort of flights + comparators.
+    """
+    comparators = sorted(comparators, key=lambda x: -x.get("value_per_mile_cents", 0))
+    return list(heapq.merge(flights, comparators, key=lambda x: -x.get("value_per_mile_cents", 0)))
@@ -1,41 +1,341 @@
-from typing import Dict, List
-from routing import best_routes
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple
+from metrics import span
+from ranking import TOP_FLIGHTS, merge_recommendations, rank_flights
+from airports import expand_location, is_metro_code
+from award_charts import get_award_chart
+from pricing import PRICING_TOP_K, confirm_prices, confirm_prices_async, pricing_key
+from reference import breaker_state
+from routing import (
+    DEGRADED_SOURCES, Route, award_miles, best_routes_with_source, best_routes_with_source_async, route_fingerprint
+)
+from sql_lite import FEEDBACK_MIN_RATINGS, get_feedback_aggregates
 from value_calc import (
-    FLIGHT_AWARD_CPM, HOTEL_CPM, GIFT_CARD_CPM,
-    miles_needed_for_value, value_per_mile, redemption_summary
+    ESTIMATED_FLIGHT_TAXES_USD, FLIGHT_AWARD_CPM, HOTEL_CPM, GIFT_CARD_CPM,
+    value_per_mile, redemption_summary
 )
 
+# Per-request limits for the concurrent search fan-out
+SEARCH_CONCURRENCY = int(os.getenv("RECOMMEND_SEARCH_CONCURRENCY", "9"))  # a 3x3 metro search in one wave
+SEARCH_DEADLINE = float(os.getenv("RECOMMEND_DEADLINE", "8"))
+# Widest flexible-date window (days either side of the requested date)
+MAX_FLEX_DAYS = 7
+
 
-def recommend_best_redemptions(origin: str, destination: str, departure_date: str, miles_available: int, adults: int = 1) -> Dict:
+@dataclass(slots=True)
+class FlightCandidate:
+    """
+    A route priced as an award for one user; exported to a dict only for the final picks.
+    """
+    route: Route
+    origin: str
+    destination: str
+    departure_date: str
+    estimated_miles_needed: int
+    value_per_mile_cents: float
+    affordable: bool
+    route_rating: float = 0.0      # average user rating for origin/destination, 0 if too few
+    route_rating_count: int = 0
+    taxes_usd: float = ESTIMATED_FLIGHT_TAXES_USD
+    confirmed_price: Optional[float] = None   # set once the offer's price is confirmed
+    chart_priced: bool = False                # miles from the award chart rather than the CPM estimate
+
+    @property
+    def price_total(self) -> float:
+        return self.route.price_total if self.confirmed_price is None else self.confirmed_price
+
+    def to_dict(self) -> Dict:
+        route = self.route
+        return {
+            "type": "flight_award",
+            "origin": self.origin,
+            "destination": self.destination,
+            "departure_date": self.departure_date,
+            "direct": route.direct,
+            "price_total": self.price_total,
+            "currency": route.currency,
+            "taxes_usd": self.taxes_usd,
+            "price_confirmed": self.confirmed_price is not None,
+            "cabin": route.cabin,
+            "estimated_miles_needed": self.estimated_miles_needed,
+            "miles_from_award_chart": self.chart_priced,
+            "value_per_mile_cents": self.value_per_mile_cents,
+            "affordable": self.affordable,
+            "route_rating": self.route_rating or None,
+            "segments": [seg.to_dict() for seg in route.segments],
+        }
+
+
+def recommend_best_redemptions(origin: str, destination: str, departure_date: str, miles_available: int, adults: int = 1,
+                               flex_days: int = 0, program: Optional[str] = None) -> Dict:
     """
     Inputs:
       - origin, destination, departure_date, miles_available
+      - flex_days: also search this many days either side of departure_date
+      - program: award chart to price flights with (default DEFAULT_AWARD_PROGRAM)
     Process:
       - Gather public data: flight cash offers via Amadeus
+      - Price each flight in miles from the award chart
       - Compute value-per-mile across categories
     Output:
       - Sorted recommendations with rationale
+      - With flex_days, a per-day calendar of the best value found
+      - `upstream`: circuit breaker state and whether offers came from a degraded source
+    Flexible-date and metro searches run recommend_best_redemptions_async; code that
+    is already inside an event loop should await that instead of calling this.
     """
+    program = get_award_chart(program).program
+    if flex_days or is_metro_code(origin) or is_metro_code(destination):
+        return _run_coroutine(recommend_best_redemptions_async(
+            origin, destination, departure_date, miles_available, adults=adults, flex_days=flex_days, program=program
+        ))
+
     # Flight options
-    routes = best_routes(origin, destination, departure_date, adults=adults, max_results=10)
-
-    flight_candidates: List[Dict] = []
-    for r in routes:
-        taxes = 5.60
-        miles_needed = miles_needed_for_value(r["price_total"], FLIGHT_AWARD_CPM, taxes)
-        vpm = value_per_mile(r["price_total"], miles_needed, taxes)
-        affordable = miles_needed <= miles_available
-        flight_candidates.append({
-            "type": "flight_award",
-            "direct": r["direct"],
-            "price_total": r["price_total"],
-            "currency": r["currency"],
-            "estimated_miles_needed": miles_needed,
-            "value_per_mile_cents": round(vpm * 100, 2),
-            "affordable": affordable,
-            "segments": r["segments"],
+    with span("recommender.search"):
+        routes, source = best_routes_with_source(origin, destination, departure_date, adults=adults, max_results=10)
+    flight_candidates = [
+        _flight_candidate(r, miles_available, origin, destination, departure_date, program) for r in routes
+    ]
+    # Ratings break value ties, so they must be on the candidates before the pricing picks
+    _apply_route_ratings(flight_candidates)
+    with span("recommender.pricing"):
+        top = rank_flights(flight_candidates, PRICING_TOP_K)
+        _apply_confirmed_prices(top, confirm_prices([f.route for f in top]), miles_available, program)
+    with span("recommender.rank"):
+        result = _rank_recommendations(flight_candidates, miles_available, program)
+    result["upstream"] = _upstream_status([source])
+    return result
+
+
+async def recommend_best_redemptions_async(origin: str, destination: str, departure_date: str, miles_available: int,
+                                           adults: int = 1, departure_dates: Optional[Sequence[str]] = None,
+                                           origins: Optional[Sequence[str]] = None,
+                                           destinations: Optional[Sequence[str]] = None,
+                                           flex_days: int = 0,
+                                           concurrency: int = SEARCH_CONCURRENCY,
+                                           deadline: float = SEARCH_DEADLINE,
+                                           program: Optional[str] = None) -> Dict:
+    """
+    Async variant of recommend_best_redemptions.
+    Searches every origin x destination x date combination concurrently (at most
+    `concurrency` at a time), metro codes expanded to their airports, and merges
+    the de-duplicated offers into one ranking. Searches still
+    running after `deadline` seconds are dropped and reported in `searches`.
+    With flex_days, the dates are the window around departure_date and the result
+    also carries a `calendar` of the best value per day.
+    """
+    program = get_award_chart(program).program
+    queries = search_queries(origin, destination, departure_date, departure_dates, origins, destinations, flex_days)
+    with span("recommender.search"):
+        results, searches = await gather_routes(queries, adults=adults, concurrency=concurrency, deadline=deadline)
+
+    flight_candidates: List[FlightCandidate] = []
+    seen = set()
+    for (q_origin, q_destination, q_date), routes in results:
+        for r in routes:
+            # The same itinerary can come back for more than one airport pair of a date
+            fingerprint = (q_date,) + route_fingerprint(r)
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            flight_candidates.append(_flight_candidate(r, miles_available, q_origin, q_destination, q_date, program))
+
+    # Ratings break value ties, so they must be on the candidates before the pricing picks
+    _apply_route_ratings(flight_candidates)
+    with span("recommender.pricing"):
+        top = rank_flights(flight_candidates, PRICING_TOP_K)
+        _apply_confirmed_prices(top, await confirm_prices_async([f.route for f in top]), miles_available, program)
+    with span("recommender.rank"):
+        result = _rank_recommendations(flight_candidates, miles_available, program)
+    result["searches"] = searches
+    result["upstream"] = _upstream_status([s["source"] for s in searches if s["source"]])
+    if flex_days:
+        result["calendar"] = _best_by_date(flight_candidates, searches)
+    return result
+
+
+def _run_coroutine(coro):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Called from inside an event loop, where asyncio.run() refuses to nest: run it on a
+    # helper thread's own loop (this blocks the caller's loop until it finishes)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+def search_queries(origin: str, destination: str, departure_date: str,
+                   departure_dates: Optional[Sequence[str]] = None, origins: Optional[Sequence[str]] = None,
+                   destinations: Optional[Sequence[str]] = None, flex_days: int = 0) -> List[Tuple[str, str, str]]:
+    """
+    The (origin, destination, date) searches recommend_best_redemptions_async runs for these inputs.
+    Metro-area codes (e.g. NYC) expand to all of their airports.
+    """
+    if flex_days and not departure_dates:
+        departure_dates = date_window(departure_date, flex_days)
+    return list(product(
+        origins or expand_location(origin),
+        destinations or expand_location(destination),
+        departure_dates or [departure_date],
+    ))
+
+
+def date_window(departure_date: str, flex_days: int, today: Optional[date] = None) -> List[str]:
+    """
+    ISO dates from departure_date - flex_days to departure_date + flex_days, starting
+    no earlier than today. A window entirely in the past is just departure_date.
+    """
+    center = date.fromisoformat(departure_date)
+    flex_days = max(0, min(flex_days, MAX_FLEX_DAYS))
+    first = max(-flex_days, ((today or date.today()) - center).days)
+    if first > flex_days:
+        return [departure_date]
+    return [(center + timedelta(days=offset)).isoformat() for offset in range(first, flex_days + 1)]
+
+
+def _best_by_date(flight_candidates: List[FlightCandidate], searches: List[Dict]) -> List[Dict]:
+    best: Dict[str, FlightCandidate] = {}
+    for f in flight_candidates:
+        current = best.get(f.departure_date)
+        if current is None or (-f.value_per_mile_cents, f.price_total) < (-current.value_per_mile_cents, current.price_total):
+            best[f.departure_date] = f
+
+    calendar = []
+    for day in sorted({s["departure_date"] for s in searches}):
+        statuses = {s["status"] for s in searches if s["departure_date"] == day}
+        pick = best.get(day)
+        calendar.append({
+            "departure_date": day,
+            "status": "ok" if "ok" in statuses else statuses.pop(),
+            "best_value_per_mile_cents": pick.value_per_mile_cents if pick else None,
+            "price_total": pick.price_total if pick else None,
+            "currency": pick.route.currency if pick else None,
+            "affordable": pick.affordable if pick else False,
         })
+    return calendar
+
+
+async def gather_routes(queries: Sequence[Tuple[str, str, str]], adults: int = 1,
+                        concurrency: int = SEARCH_CONCURRENCY,
+                        deadline: float = SEARCH_DEADLINE) -> Tuple[List[Tuple[Tuple[str, str, str], List[Route]]], List[Dict]]:
+    """
+    Runs best_routes for each (origin, destination, date) query concurrently.
+    Returns the (query, routes) pairs that finished in time, in query order,
+    plus per-query status, offer source and timing.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: Dict[int, float] = {}
+
+    async def search(i: int, query: Tuple[str, str, str]) -> Tuple[List[Route], str]:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                return await best_routes_with_source_async(*query, adults=adults, max_results=10)
+            finally:
+                timings[i] = time.perf_counter() - start
+
+    tasks = [asyncio.ensure_future(search(i, q)) for i, q in enumerate(queries)]
+    if tasks:
+        await asyncio.wait(tasks, timeout=deadline)
+
+    results = []
+    searches = []
+    for i, (query, task) in enumerate(zip(queries, tasks)):
+        status = "ok"
+        routes: List[Route] = []
+        source = None
+        if not task.done():
+            task.cancel()
+            status = "timeout"
+        elif task.exception() is not None:
+            status = "error"
+        else:
+            routes, source = task.result()
+            results.append((query, routes))
+        searches.append({
+            "origin": query[0],
+            "destination": query[1],
+            "departure_date": query[2],
+            "status": status,
+            "routes": len(routes),
+            "source": source,
+            "elapsed_ms": round(timings[i] * 1000, 1) if i in timings else None,
+        })
+    return results, searches
+
+
+def _upstream_status(sources: Sequence[str]) -> Dict:
+    return {
+        "breaker": breaker_state(),
+        "degraded": any(s in DEGRADED_SOURCES for s in sources),
+        "sources": sorted(set(sources)),
+    }
+
+
+def _flight_candidate(r: Route, miles_available: int, origin: str, destination: str, departure_date: str,
+                      program: Optional[str] = None) -> FlightCandidate:
+    taxes = ESTIMATED_FLIGHT_TAXES_USD
+    miles_needed, chart_priced = award_miles(r, r.price_total, taxes, program)
+    vpm = value_per_mile(r.price_total, miles_needed, taxes)
+    return FlightCandidate(
+        r, origin, destination, departure_date,
+        miles_needed, round(vpm * 100, 2), miles_needed <= miles_available,
+        chart_priced=chart_priced,
+    )
 
+
+def _apply_confirmed_prices(flight_candidates: List[FlightCandidate], confirmed: Dict[str, Dict],
+                            miles_available: int, program: Optional[str] = None) -> None:
+    """
+    Re-prices candidates whose offers were confirmed with the real total and taxes.
+    """
+    if not confirmed:
+        return
+    for f in flight_candidates:
+        price = confirmed.get(pricing_key(f.route))
+        if price is None:
+            continue
+        f.confirmed_price = price["price_total"]
+        f.taxes_usd = price["taxes_usd"]
+        miles_needed, f.chart_priced = award_miles(f.route, f.confirmed_price, f.taxes_usd, program)
+        f.estimated_miles_needed = miles_needed
+        f.value_per_mile_cents = round(value_per_mile(f.confirmed_price, miles_needed, f.taxes_usd) * 100, 2)
+        f.affordable = miles_needed <= miles_available
+
+
+def _apply_route_ratings(flight_candidates: List[FlightCandidate]) -> None:
+    """
+    Attaches user ratings per origin/destination (a cheap re-ranking signal:
+    better-rated routes win value-per-mile ties). Routes with fewer than
+    FEEDBACK_MIN_RATINGS ratings are left unrated.
+    """
+    pairs = {(f.origin, f.destination) for f in flight_candidates}
+    if not pairs:
+        return
+    try:
+        ratings = get_feedback_aggregates().route_ratings(pairs)
+    except sqlite3.Error:
+        return
+    for f in flight_candidates:
+        rating = ratings.get((f.origin, f.destination))
+        if rating and rating["count"] >= FEEDBACK_MIN_RATINGS:
+            f.route_rating = rating["avg_rating"]
+            f.route_rating_count = rating["count"]
+
+
+def _rank_recommendations(flight_candidates: List[FlightCandidate], miles_available: int,
+                          program: Optional[str] = None) -> Dict:
+    """
+    Ranks flight candidates (route ratings already applied) against the hotel and gift card comparators.
+    """
     # Hotel and gift card comparators (generic)
     sample_hotel_cash = 220.0
     hotel_summary = redemption_summary(sample_hotel_cash, taxes_fees_usd=0.0, cpm_cents=HOTEL_CPM)
@@ -47,28 +347,26 @@ def recommend_best_redemptions(origin: str, destination: str, departure_date: st
         "value_per_mile_cents": GIFT_CARD_CPM
     }
 
-    # Pick top 5 flight options user can afford in miles; if none, show top 3 overall
-    affordable_flights = [f for f in flight_candidates if f["affordable"]]
-    affordable_flights.sort(key=lambda x: -x["value_per_mile_cents"])
-    top_flights = (affordable_flights or sorted(flight_candidates, key=lambda x: -x["value_per_mile_cents"]))[:5]
+    # Pick top 5 flight options user can afford in miles; if none, top 5 overall
+    top_flights = rank_flights(flight_candidates, TOP_FLIGHTS)
 
     # Overall recommendations ranked by value-per-mile proxy
-    recommendations = top_flights.copy()
-    recommendations.append({
+    hotel_option = {
         "type": "hotel_award (example)",
         "cash_price_usd": sample_hotel_cash,
         "miles_needed": hotel_summary["miles_needed"],
         "value_per_mile_cents": hotel_summary["value_per_mile_cents"]
-    })
-    recommendations.append(gift_card_option)
-
-    recommendations.sort(key=lambda x: -x.get("value_per_mile_cents", 0))
+    }
+    recommendations = merge_recommendations([f.to_dict() for f in top_flights], [hotel_option, gift_card_option])
+    chart = get_award_chart(program)
     return {
         "recommendations": recommendations,
         "assumptions": {
-            "flight_award_cpm_cents": FLIGHT_AWARD_CPM,
+            "award_program": chart.program,
+            "award_chart": chart.name,
+            "flight_award_cpm_cents": FLIGHT_AWARD_CPM,  # for airports outside the award chart
             "hotel_cpm_cents": HOTEL_CPM,
             "gift_card_cpm_cents": GIFT_CARD_CPM,
-            "flight_taxes_usd": 5.60
+            "flight_taxes_usd": ESTIMATED_FLIGHT_TAXES_USD,  # for flights without a confirmed price
         }
-    } 
\ No newline at end of file
+    }
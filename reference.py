@@ -1,35 +1,704 @@
+import asyncio
+import codecs
+import functools
+import json
 import os
+import random
+import re
+import threading
+import time
 import requests
+from collections import deque
 from dotenv import load_dotenv
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
+from metrics import REGISTRY, UPSTREAM_RESPONSES, span, stats_collector
 
 # Load credentials
 load_dotenv()
 CLIENT_ID = os.getenv("AMADEUS_API_KEY")
 CLIENT_SECRET = os.getenv("AMADEUS_API_SECRET")
 
-# Base URLs (test mode – switch to production when ready)
-TOKEN_URL = "https://test.api.amadeus.com/v1/security/oauth2/token"
-OFFERS_URL = "https://test.api.amadeus.com/v2/shopping/flight-offers"
-PRICING_URL = "https://test.api.amadeus.com/v1/shopping/flight-offers/pricing"
-BOOKING_URL = "https://test.api.amadeus.com/v1/booking/flight-orders"
+# Base URLs (test mode – switch to production when ready; point at a stub server for benchmarks)
+AMADEUS_BASE_URL = os.getenv("AMADEUS_BASE_URL", "https://test.api.amadeus.com").rstrip("/")
+TOKEN_URL = f"{AMADEUS_BASE_URL}/v1/security/oauth2/token"
+OFFERS_URL = f"{AMADEUS_BASE_URL}/v2/shopping/flight-offers"
+PRICING_URL = f"{AMADEUS_BASE_URL}/v1/shopping/flight-offers/pricing"
+BOOKING_URL = f"{AMADEUS_BASE_URL}/v1/booking/flight-orders"
+# Endpoint label for upstream metrics
+_ENDPOINTS = {TOKEN_URL: "token", OFFERS_URL: "offers", PRICING_URL: "pricing", BOOKING_URL: "booking"}
+
+
+# Treat a token as expired this many seconds before Amadeus says it is
+TOKEN_REFRESH_MARGIN = 60
+# Back-off between failed background refresh attempts
+TOKEN_RETRY_INTERVAL = 5
+
+
+class TokenManager:
+    """
+    Process-wide holder for the Amadeus bearer token.
+
+    The token is reused until `refresh_margin` seconds before its `expires_in`.
+    Concurrent callers that find it stale block on a single refresh instead of
+    each minting their own, and a daemon thread renews it ahead of expiry so
+    request threads normally never wait on the token endpoint.
+    """
+
+    def __init__(self, fetch: Callable[[], Dict],
+                 refresh_margin: float = TOKEN_REFRESH_MARGIN,
+                 background: bool = True):
+        self._fetch = fetch
+        self._refresh_margin = refresh_margin
+        self._background = background
+        self._lock = threading.Lock()
+        self._state: Tuple[Optional[str], float] = (None, 0.0)  # (token, expires_at)
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.refresh_count = 0
+
+    def _is_fresh(self, state: Tuple[Optional[str], float]) -> bool:
+        token, expires_at = state
+        return token is not None and time.monotonic() < expires_at - self._refresh_margin
+
+    def get_token(self) -> str:
+        state = self._state
+        if self._is_fresh(state):
+            return state[0]
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self._is_fresh(self._state):
+                self._refresh_locked()
+            token = self._state[0]
+        self._ensure_refresher()
+        return token
+
+    def invalidate(self) -> None:
+        """
+        Drop the cached token, e.g. after the API rejects it with a 401.
+        """
+        with self._lock:
+            self._state = (None, 0.0)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _refresh_locked(self) -> None:
+        payload = self._fetch()
+        expires_in = float(payload.get("expires_in", 1799))
+        self._state = (payload["access_token"], time.monotonic() + expires_in)
+        self.refresh_count += 1
+
+    def _ensure_refresher(self) -> None:
+        if not self._background or self._stop.is_set():
+            return
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name="amadeus-token-refresh", daemon=True
+                )
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            # Renew one margin earlier than foreground callers would, so they keep a fresh token
+            wait = self._state[1] - 2 * self._refresh_margin - time.monotonic()
+            if self._stop.wait(max(wait, TOKEN_RETRY_INTERVAL)):
+                return
+            try:
+                with self._lock:
+                    self._refresh_locked()
+            except Exception:
+                # Foreground callers fall back to a synchronous refresh if this keeps failing
+                if self._stop.wait(TOKEN_RETRY_INTERVAL):
+                    return
+
+
+# HTTP client tuning (overridable per deployment)
+POOL_SIZE = int(os.getenv("AMADEUS_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.getenv("AMADEUS_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("AMADEUS_READ_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("AMADEUS_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.25       # seconds, doubled per attempt before jitter
+RETRY_BACKOFF_MAX = 4.0    # cap for computed back-off
+RETRY_AFTER_MAX = 10.0     # give up rather than honour longer 429 Retry-After waits
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+STREAM_CHUNK_SIZE = 64 * 1024
+# Circuit breaker around Amadeus: open when at least BREAKER_FAILURE_RATE of the last
+# BREAKER_WINDOW calls (and BREAKER_MIN_CALLS or more) failed or took over BREAKER_SLOW_CALL seconds
+BREAKER_WINDOW = int(os.getenv("AMADEUS_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("AMADEUS_BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("AMADEUS_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL = float(os.getenv("AMADEUS_BREAKER_SLOW_CALL", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("AMADEUS_BREAKER_OPEN_SECONDS", "30"))
+# Offers per pricing call (Amadeus accepts up to 6 flightOffers per request)
+PRICING_BATCH_SIZE = 6
+# Upper bound on upstream calls in flight across all event loops in this process
+ASYNC_MAX_CONCURRENCY = int(os.getenv("AMADEUS_ASYNC_CONCURRENCY", str(POOL_SIZE)))
+
+
+class AmadeusError(RuntimeError):
+    pass
+
+
+class CircuitOpenError(AmadeusError):
+    """
+    Raised without calling Amadeus while the circuit breaker is open.
+    """
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator:
+    """
+    Incrementally yields the elements of the array stored under `key` in a
+    top-level JSON object, reading `chunks` only as far as needed. Sibling
+    values before the array are decoded and discarded; nothing after the
+    array is read. Peak memory is one element plus one chunk.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    source = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill() -> None:
+        nonlocal buf, pos, eof
+        chunk = next(source, None)
+        if chunk is None:
+            eof = True
+            text = utf8.decode(b"", final=True)
+        else:
+            text = utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        buf = buf[pos:] + text
+        pos = 0
+
+    def peek() -> str:
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                raise ValueError("unexpected end of JSON stream")
+            fill()
+
+    def expect(char: str) -> None:
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"expected {char!r} at offset {pos} of JSON stream")
+        pos += 1
+
+    def value():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                result, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                # A number at the end of the buffer may continue in the next chunk
+                fill()
+                continue
+            pos = end
+            return result
+
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        name = value()
+        expect(":")
+        if name == key:
+            expect("[")
+            if peek() == "]":
+                return
+            while True:
+                yield value()
+                if peek() == "]":
+                    return
+                expect(",")
+        value()
+        if peek() == "}":
+            return
+        expect(",")
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent traffic so an upstream outage
+    cannot multiply our request volume. Every request deposits `ratio`
+    tokens, every retry withdraws one, and `min_per_second` tokens trickle
+    in so low-traffic workers can still retry occasionally.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, capacity: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._balance = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self) -> None:
+        now = time.monotonic()
+        self._balance = min(self.capacity, self._balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._refill_locked()
+            self._balance = min(self.capacity, self._balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill_locked()
+            if self._balance < 1.0:
+                return False
+            self._balance -= 1.0
+            return True
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter: `rate` requests per second on
+    average with bursts of up to `burst`. acquire() blocks until a token is free.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if not rate > 0:
+            raise ValueError(f"rate must be greater than 0, got {rate}")
+        if burst is not None and burst < 1:
+            raise ValueError(f"burst must be at least 1, got {burst}")
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Takes one token, sleeping if needed. Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """
+    Closed -> open when too many recent calls failed or were slow; open -> half-open
+    after `open_seconds`, when up to `half_open_probes` calls are let through. A
+    successful probe closes the breaker, a failed one re-opens it. Every allow()
+    that returns True must be followed by exactly one record(), or by release()
+    when the call ended for a reason that says nothing about upstream health.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, slow_call: float = BREAKER_SLOW_CALL,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, half_open_probes: int = 1):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._stats = {"rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._stats["rejected"] += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self._stats["rejected"] += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, success: bool, elapsed: float = 0.0) -> None:
+        ok = success and elapsed < self.slow_call
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes -= 1
+                if ok:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open_locked()
+                return
+            if self._state == self.OPEN:
+                return
+            self._outcomes.append(ok)
+            calls = len(self._outcomes)
+            if calls >= self.min_calls and self._outcomes.count(False) / calls >= self.failure_rate:
+                self._open_locked()
+
+    def release(self) -> None:
+        """
+        Ends an allowed call without recording an outcome (e.g. it was interrupted).
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes -= 1
+
+    def _open_locked(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._stats["opened"] += 1
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            stats = {f"breaker_{k}": v for k, v in self._stats.items()}
+        stats["breaker_state"] = state
+        stats["breaker_open"] = int(state == self.OPEN)
+        return stats
+
+
+def _retry_after_seconds(resp: requests.Response) -> Optional[float]:
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((when - datetime.now(when.tzinfo)).total_seconds(), 0.0)
+
+
+class AmadeusClient:
+    """
+    Thin Amadeus client that owns a pooled keep-alive `requests.Session`.
+
+    Every call has connect/read timeouts, transient failures (connection
+    errors, timeouts, 429 and 5xx) are retried with jittered exponential
+    back-off within a retry budget, and 429 `Retry-After` is honoured.
+    An optional TokenBucket paces every request, retries included, and a
+    CircuitBreaker fails calls fast (CircuitOpenError) during an outage.
+    """
+
+    def __init__(self, client_id: Optional[str] = CLIENT_ID, client_secret: Optional[str] = CLIENT_SECRET,
+                 pool_size: int = POOL_SIZE, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 retry_budget: Optional[RetryBudget] = None, token_manager: Optional[TokenManager] = None,
+                 rate_limiter: Optional[TokenBucket] = None, breaker: Optional[CircuitBreaker] = None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.tokens = token_manager or TokenManager(fetch=self._request_token)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "rate_limited": 0, "budget_exhausted": 0,
+                          "short_circuited": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * (2 ** attempt)))
+
+    def _request(self, method: str, url: str, authenticated: bool = True, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        headers = dict(kwargs.pop("headers", {}) or {})
+        endpoint = _ENDPOINTS.get(url, "other")
+        reauthenticated = False
+        attempt = 0
+        while True:
+            if authenticated:
+                headers["Authorization"] = f"Bearer {self.tokens.get_token()}"
+            # Check the breaker first so failing fast neither waits on nor spends rate-limit tokens
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                raise CircuitOpenError(f"circuit open for {endpoint}; not calling Amadeus")
+            if self.rate_limiter is not None:
+                try:
+                    self.rate_limiter.acquire()
+                except BaseException:
+                    self.breaker.release()
+                    raise
+            self._count("requests")
+            self.retry_budget.record_request()
+            delay = None
+            started = time.monotonic()
+            try:
+                resp = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.breaker.record(False)
+                UPSTREAM_RESPONSES.inc(endpoint, "error")
+                if attempt >= self.max_retries:
+                    raise
+                resp = None
+                delay = self._backoff(attempt)
+            except BaseException:
+                # Ctrl-C, shutdown or a bug on our side: not an upstream failure
+                self.breaker.release()
+                raise
+            if resp is not None:
+                # 429 and 5xx count against the breaker; other 4xx are our own mistakes
+                self.breaker.record(resp.status_code not in RETRY_STATUSES, time.monotonic() - started)
+                UPSTREAM_RESPONSES.inc(endpoint, str(resp.status_code))
+                if resp.status_code == 401 and authenticated and not reauthenticated:
+                    # Token revoked or expired early: mint a new one once, outside the retry budget
+                    reauthenticated = True
+                    self.tokens.invalidate()
+                    resp.close()
+                    continue
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    resp.raise_for_status()
+                    return resp
+                delay = self._backoff(attempt)
+                if resp.status_code == 429:
+                    self._count("rate_limited")
+                    retry_after = _retry_after_seconds(resp)
+                    if retry_after is not None:
+                        if retry_after > RETRY_AFTER_MAX:
+                            resp.raise_for_status()
+                        delay = retry_after + random.uniform(0, RETRY_BACKOFF)
+            if not self.retry_budget.try_spend():
+                self._count("budget_exhausted")
+                if resp is None:
+                    raise AmadeusError(f"retry budget exhausted for {url}")
+                resp.raise_for_status()
+            if resp is not None:
+                resp.close()
+            self._count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def _request_token(self) -> Dict:
+        """
+        Mint a new OAuth2 token using the client credentials flow.
+        Returns the raw token payload ({"access_token": ..., "expires_in": ...}).
+        """
+        if not self.client_id or not self.client_secret:
+            raise AmadeusError("Amadeus credentials are not configured")
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret
+        }
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        with span("amadeus.token"):
+            resp = self._request("POST", TOKEN_URL, authenticated=False, data=data, headers=headers)
+            return resp.json()
+
+    def search_flights(self, origin: str, destination: str, departure_date: str,
+                       adults: int = 1, max_results: int = 5) -> Dict:
+        params = {
+            "originLocationCode": origin,
+            "destinationLocationCode": destination,
+            "departureDate": departure_date,
+            "adults": adults,
+            "max": max_results
+        }
+        with span("amadeus.search"):
+            resp = self._request("GET", OFFERS_URL, params=params)
+        with span("amadeus.parse_json"):
+            return resp.json()
+
+    def iter_flight_offers(self, origin: str, destination: str, departure_date: str,
+                           adults: int = 1, max_results: int = 250) -> Iterator[Dict]:
+        """
+        Like search_flights, but yields offers one at a time while the response body
+        streams in. Reading stops at the end of the `data` array, so the trailing
+        `dictionaries` block is never downloaded or parsed.
+        """
+        params = {
+            "originLocationCode": origin,
+            "destinationLocationCode": destination,
+            "departureDate": departure_date,
+            "adults": adults,
+            "max": max_results
+        }
+        resp = self._request("GET", OFFERS_URL, params=params, stream=True)
+        try:
+            yield from iter_json_array(resp.iter_content(STREAM_CHUNK_SIZE), "data")
+        finally:
+            resp.close()
+
+    def confirm_offer_price(self, offer: Dict) -> Dict:
+        body = {"data": {"type": "flight-offers-pricing", "flightOffers": [offer]}}
+        headers = {"Content-Type": "application/json"}
+        with span("amadeus.pricing"):
+            return self._request("POST", PRICING_URL, json=body, headers=headers).json()
+
+    def confirm_offer_prices(self, offers: List[Dict]) -> List[Dict]:
+        """
+        Prices up to PRICING_BATCH_SIZE offers in one call and returns the priced
+        offers as Amadeus sends them. They may come back reordered or with offers
+        missing, so match them to the input by `id`; ids must be unique in the call.
+        """
+        if len(offers) > PRICING_BATCH_SIZE:
+            raise ValueError(f"at most {PRICING_BATCH_SIZE} offers per pricing call")
+        body = {"data": {"type": "flight-offers-pricing", "flightOffers": list(offers)}}
+        headers = {"Content-Type": "application/json"}
+        with span("amadeus.pricing"):
+            priced = self._request("POST", PRICING_URL, json=body, headers=headers).json()
+        return priced.get("data", {}).get("flightOffers", [])
+
+    def stats(self) -> Dict:
+        """
+        Request/retry counters, circuit breaker state and connection reuse read
+        from the urllib3 pools.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        opened = served = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    served += pool.num_requests
+        stats["connections_opened"] = opened
+        stats["connections_reused"] = max(served - opened, 0)
+        stats.update(self.breaker.stats())
+        return stats
+
+    def close(self) -> None:
+        self.tokens.stop()
+        self.session.close()
+
+
+_default_client: Optional[AmadeusClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> AmadeusClient:
+    """
+    Returns the process-wide Amadeus client, creating it on first use.
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = AmadeusClient()
+    return _default_client
+
+
+def _client_stats() -> Dict:
+    # Only report once a request has actually created the client
+    return _default_client.stats() if _default_client is not None else {}
+
+
+REGISTRY.add_collector(stats_collector("amadeus_client", _client_stats, "Amadeus client counters"))
+
+
+class AsyncAmadeusClient:
+    """
+    asyncio facade over AmadeusClient.
+
+    `requests` is blocking, so calls run on a shared worker pool sized like
+    the HTTP connection pool. That pool is the global cap on concurrent
+    upstream work: every event loop in the process queues behind it.
+    """
+
+    def __init__(self, client: Optional[AmadeusClient] = None, max_concurrency: int = ASYNC_MAX_CONCURRENCY):
+        self._client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="amadeus")
+
+    @property
+    def client(self) -> AmadeusClient:
+        return self._client or get_client()
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Runs a blocking call on the upstream worker pool and awaits its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def search_flights(self, origin: str, destination: str, departure_date: str,
+                             adults: int = 1, max_results: int = 5) -> Dict:
+        return await self.run(self.client.search_flights, origin, destination, departure_date, adults, max_results)
+
+    async def confirm_offer_price(self, offer: Dict) -> Dict:
+        return await self.run(self.client.confirm_offer_price, offer)
+
+    async def confirm_offer_prices(self, offers: List[Dict]) -> List[Dict]:
+        return await self.run(self.client.confirm_offer_prices, offers)
+
+
+_default_async_client: Optional[AsyncAmadeusClient] = None
+
+
+def get_async_client() -> AsyncAmadeusClient:
+    """
+    Returns the process-wide async Amadeus client, creating it on first use.
+    """
+    global _default_async_client
+    if _default_async_client is None:
+        with _default_client_lock:
+            if _default_async_client is None:
+                _default_async_client = AsyncAmadeusClient()
+    return _default_async_client
+
+
+def breaker_state() -> str:
+    """
+    State of the shared client's circuit breaker: closed, open or half_open.
+    """
+    return get_client().breaker.state
 
 
 def get_access_token() -> str:
     """
     Authenticate with Amadeus API using OAuth2 client credentials.
-    Returns a Bearer token for subsequent API calls.
-    """
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    resp = requests.post(TOKEN_URL, data=data, headers=headers)
-    resp.raise_for_status()
-    return resp.json()["access_token"]
+    Returns a Bearer token for subsequent API calls, reusing the cached one while valid.
+    """
+    return get_client().tokens.get_token()
 
 def search_flights(origin: str, destination: str, departure_date: str,
                    adults: int = 1, max_results: int = 5) -> Dict:
@@ -37,30 +706,21 @@ def search_flights(origin: str, destination: str, departure_date: str,
     Search for flight offers given origin, destination, and date. 
     Returns a JSON dictionary of offers.
     """
-    token = get_access_token()
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {
-        "originLocationCode": origin,
-        "destinationLocationCode": destination,
-        "departureDate": departure_date,
-        "adults": adults,
-        "max": max_results
-    }
-    resp = requests.get(OFFERS_URL, headers=headers, params=params)
-    resp.raise_for_status()
-    return resp.json()
+    return get_client().search_flights(origin, destination, departure_date, adults, max_results)
+
+def search_flights_stream(origin: str, destination: str, departure_date: str,
+                          adults: int = 1, max_results: int = 250) -> Iterator[Dict]:
+    """
+    Streaming search_flights: yields raw offers as the response is parsed.
+    """
+    return get_client().iter_flight_offers(origin, destination, departure_date, adults, max_results)
 
 def confirm_offer_price(offer: Dict) -> Dict:
     """
     Confirm a flight offer’s price (ensures availability, tax updates, etc.).
     Returns full pricing breakdown JSON.
     """
-    token = get_access_token()
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    body = {"data": {"type": "flight-offers-pricing", "flightOffers": [offer]}}
-    resp = requests.post(PRICING_URL, json=body, headers=headers)
-    resp.raise_for_status()
-    return resp.json()
+    return get_client().confirm_offer_price(offer)
 
 
 def filter_by_flight_number(offers_data: Dict, flight_code: str) -> List[Dict]:
@@ -86,9 +746,14 @@ def simplify_offers(offers_data: dict) -> list:
     - departure/arrival airports
     - departure/arrival times (date + time)
     """
-    simplified = []
+    return list(iter_simplified_offers(offers_data.get("data", [])))
 
-    for offer in offers_data.get("data", []):
+def iter_simplified_offers(offers: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Generator form of simplify_offers over an iterable of raw offers,
+    e.g. the output of search_flights_stream.
+    """
+    for offer in offers:
         price = offer.get("price", {}).get("total")
         currency = offer.get("price", {}).get("currency")
         itineraries = offer.get("itineraries", [])
@@ -102,7 +767,7 @@ def simplify_offers(offers_data: dict) -> list:
                 arrival_airport = segment.get("arrival", {}).get("iataCode")
                 arrival_time = segment.get("arrival", {}).get("at")
 
-                simplified.append({
+                yield {
                     "flight_code": flight_code,
                     "airline_code": airline_code,
                     "price": f"{price} {currency}",
@@ -110,61 +775,35 @@ def simplify_offers(offers_data: dict) -> list:
                     "departure_time": departure_time,
                     "arrival_airport": arrival_airport,
                     "arrival_time": arrival_time
-                })
-    return simplified
+                }
 
-def simplify_data(simplified_offers: list) -> str:
+def simplify_data(simplified_offers: Iterable[Dict]) -> str:
     """
-    Takes in simplified_offers and turns it into easy-to-read data
+    Takes in simplified_offers and turns it into easy-to-read data.
+    For large exports stream export.iter_export() instead of building the whole string.
     """
-    routes = []
-    current_route = []
-
-    for flight in simplified_offers:
-        if not current_route:
-            current_route.append(flight)
-        else:
-            last_arrival = current_route[-1]["arrival_airport"]
-            if last_arrival == flight["departure_airport"]:
-                current_route.append(flight)
-            else:
-                routes.append(current_route)
-                current_route = [flight]
-    if current_route:
-        routes.append(current_route)
-
-    final = ""
-    route_num = 1
-    for route in routes:
-        if len(route) > 1:
-            final += f"Route {route_num}: Connecting flight with {len(route)} segments\n\n"
-        else:
-            final += f"Route {route_num}: Direct flight\n\n"
+    from export import iter_route_groups, iter_text
 
-        for i, flight in enumerate(route, start=1):
-            final += f"  Segment {i}: {flight.get('departure_airport')} --> {flight.get('arrival_airport')}\n"
-            final += f"    Flight Code: {flight.get('flight_code')}\n"
-            final += f"    Airline Code: {flight.get('airline_code')}\n"
-            final += f"    Departure: {iso_to_readable(flight.get('departure_time'))} from {flight.get('departure_airport')}\n"
-            final += f"    Arrival:   {iso_to_readable(flight.get('arrival_time'))} at {flight.get('arrival_airport')}\n"
-            final += f"    Price:     {flight.get('price')}\n\n"
-
-        route_num += 1
-
-    return final
+    return "".join(iter_text(iter_route_groups(simplified_offers)))
 
 
+@functools.lru_cache(maxsize=4096)
 def iso_to_readable(iso: str) -> str:
     """
-    Converts iso-time to readable time
+    Converts iso-time to readable time. Cached: departure and arrival times repeat
+    heavily across offers, and parsing plus strftime dominates report rendering.
     """
     dt = datetime.fromisoformat(iso)
     readable_time = dt.strftime("%B %d, %Y at %I:%M %p")
 
     return readable_time
 
-def save_flights_to_db(simplified_offers: List[Dict], route_name: str) -> None:
+def save_flights_to_db(offers_data: Dict, origin: str, destination: str, departure_date: str,
+                       adults: int = 1) -> int:
     """
-    Saves flight data to SQLite database.
+    Saves the raw offers from a search_flights response to the SQLite offer store.
+    Returns the number of offers written.
     """
-    
\ No newline at end of file
+    from sql_lite import get_offer_store
+
+    return get_offer_store().save_offers(origin, destination, departure_date, offers_data.get("data", []), adults)
@@ -1,11 +1,184 @@
-from typing import List, Dict
-from reference import search_flights
-from value_calc import miles_needed_for_value, value_per_mile, FLIGHT_AWARD_CPM
+import heapq
+import logging
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+from award_charts import get_award_chart
+from reference import get_async_client, search_flights, search_flights_stream
+from offer_cache import build_offer_cache, search_cache_key
+from metrics import REGISTRY, span, stats_collector
+from single_flight import SingleFlight
+from sql_lite import OFFER_STORE_MAX_AGE, get_offer_store
+from value_calc import miles_needed_for_value, value_per_mile, ESTIMATED_FLIGHT_TAXES_USD, FLIGHT_AWARD_CPM
 
 
-def parse_routes(offers_json: Dict) -> List[Dict]:
-    routes: List[Dict] = []
-    for offer in offers_json.get("data", []):
+logger = logging.getLogger(__name__)
+
+offer_cache = build_offer_cache()
+route_searches = SingleFlight()
+
+# Where a search's offers came from; everything but "amadeus" is a degraded answer
+SOURCE_AMADEUS = "amadeus"
+DEGRADED_SOURCES = ("stale_cache", "stored", "mock")
+SEARCH_SOURCES = REGISTRY.counter("routing_search_sources_total", "Route searches by offer source.", ["source"])
+REGISTRY.add_collector(stats_collector("offer_cache", offer_cache.stats, "Offer search cache"))
+REGISTRY.add_collector(stats_collector("route_searches", route_searches.stats, "Coalesced route searches"))
+
+
+def cached_search_flights(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 10) -> Dict:
+    """
+    search_flights behind the shared TTL/LRU offer cache. Failed searches are not cached.
+    """
+    key = search_cache_key(origin, destination, departure_date, adults, max_results)
+    return offer_cache.get_or_load(
+        key, lambda: stored_or_search_flights(origin, destination, departure_date, adults, max_results),
+        stamp=_stored_fetched_at,
+    )
+
+
+def _stored_fetched_at(offers: Dict) -> Optional[float]:
+    """
+    Cache stamp for offers answered from the store: fresh for the cache TTL or until
+    the stored search passes OFFER_STORE_MAX_AGE, whichever comes first. Live offers
+    (no fetched_at) are stamped now.
+    """
+    fetched_at = offers.get("meta", {}).get("fetched_at")
+    if fetched_at is None:
+        return None
+    return min(time.time(), fetched_at + OFFER_STORE_MAX_AGE - offer_cache.ttl)
+
+
+def search_stored_at(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 10) -> Optional[float]:
+    """
+    Version stamp of the cached search for these parameters (None if not fresh in the cache).
+    """
+    return offer_cache.stored_at(search_cache_key(origin, destination, departure_date, adults, max_results))
+
+
+def cached_routes(origin: str, destination: str, departure_date: str, adults: int = 1,
+                  max_results: int = 10) -> Optional[List["Route"]]:
+    """
+    Parsed routes of the cached search for these parameters, or None if it is not fresh
+    in the cache. Never searches and does not count as a cache lookup.
+    """
+    key = search_cache_key(origin, destination, departure_date, adults, max_results)
+    if offer_cache.stored_at(key) is None:
+        return None
+    offers = offer_cache.get_stale(key)
+    return parse_routes(offers) if offers is not None else None
+
+
+def stored_or_search_flights(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 10) -> Dict:
+    """
+    Answers from the offer store when it holds a search younger than OFFER_STORE_MAX_AGE;
+    otherwise searches live and records the result in the store.
+    """
+    store = get_offer_store()
+    if OFFER_STORE_MAX_AGE > 0:
+        stored = store.latest_offers(origin, destination, departure_date, adults,
+                                     max_age=OFFER_STORE_MAX_AGE, limit=max_results)
+        if stored and stored["data"]:
+            return stored
+    offers = search_flights(origin, destination, departure_date, adults, max_results)
+    try:
+        store.save_offers(origin, destination, departure_date, offers.get("data", []), adults)
+    except sqlite3.Error:
+        # The live answer is still good; only the history misses this search
+        logger.exception("could not store offers for %s-%s on %s", origin, destination, departure_date)
+    return offers
+
+
+def _intern(code: Optional[str]) -> Optional[str]:
+    # Carrier and airport codes repeat across thousands of offers; share one string each
+    return sys.intern(code) if isinstance(code, str) else code
+
+
+@dataclass(slots=True)
+class Segment:
+    carrier_code: Optional[str]
+    number: Optional[str]
+    departure_airport: Optional[str]
+    departure_at: Optional[str]
+    arrival_airport: Optional[str]
+    arrival_at: Optional[str]
+
+    def to_dict(self) -> Dict:
+        return {
+            "carrierCode": self.carrier_code,
+            "number": self.number,
+            "departure": {"iataCode": self.departure_airport, "at": self.departure_at},
+            "arrival": {"iataCode": self.arrival_airport, "at": self.arrival_at},
+        }
+
+
+@dataclass(slots=True)
+class Route:
+    """
+    One parsed offer: first itinerary only, VPM fields filled in by best_routes.
+    `offer` keeps the raw Amadeus offer so it can be sent for price confirmation.
+    Routes returned by best_routes may be shared between callers; treat them as read-only.
+    """
+    price_total: float
+    currency: str
+    direct: bool
+    duration_iso: str
+    segments: Tuple[Segment, ...]
+    estimated_miles_needed: int = 0
+    value_per_mile_usd: float = 0.0
+    value_per_mile_cents: float = 0.0
+    cabin: str = "ECONOMY"
+    offer: Optional[Dict] = field(default=None, repr=False, compare=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            "price_total": self.price_total,
+            "currency": self.currency,
+            "direct": self.direct,
+            "duration_iso": self.duration_iso,
+            "segments": [seg.to_dict() for seg in self.segments],
+            "estimated_miles_needed": self.estimated_miles_needed,
+            "value_per_mile_usd": self.value_per_mile_usd,
+            "value_per_mile_cents": self.value_per_mile_cents,
+            "cabin": self.cabin,
+        }
+
+
+def route_fingerprint(r: Route) -> Tuple:
+    """
+    Identity of an itinerary: its flights and departure times plus the fare.
+    """
+    return (r.price_total, r.currency) + tuple(
+        (seg.carrier_code, seg.number, seg.departure_at) for seg in r.segments
+    )
+
+
+def _parse_segment(s: Dict) -> Segment:
+    departure = s.get("departure", {})
+    arrival = s.get("arrival", {})
+    return Segment(
+        _intern(s.get("carrierCode")),
+        s.get("number"),
+        _intern(departure.get("iataCode")),
+        departure.get("at"),
+        _intern(arrival.get("iataCode")),
+        arrival.get("at"),
+    )
+
+
+def parse_routes(offers_json: Dict, keep_offers: bool = True) -> List[Route]:
+    return list(iter_routes(offers_json.get("data", []), keep_offers))
+
+
+def iter_routes(offers: Iterable[Dict], keep_offers: bool = True) -> Iterator[Route]:
+    """
+    Generator form of parse_routes over an iterable of raw offers.
+    With keep_offers=False the raw offer is not attached (e.g. mock data that cannot be priced).
+    """
+    for offer in offers:
         try:
             price_total = float(offer.get("price", {}).get("total", 0.0))
         except (ValueError, TypeError):
@@ -18,19 +191,19 @@ def parse_routes(offers_json: Dict) -> List[Dict]:
         segments = it.get("segments", [])
         direct = len(segments) == 1
         duration_iso = it.get("duration", "")  # e.g., "PT5H30M"
-        routes.append({
-            "price_total": price_total,
-            "currency": currency,
-            "direct": direct,
-            "duration_iso": duration_iso,
-            "segments": [{
-                "carrierCode": s.get("carrierCode"),
-                "number": s.get("number"),
-                "departure": s.get("departure", {}),
-                "arrival": s.get("arrival", {}),
-            } for s in segments]
-        })
-    return routes
+        cabin = "ECONOMY"
+        pricings = offer.get("travelerPricings")
+        if pricings and pricings[0].get("fareDetailsBySegment"):
+            cabin = pricings[0]["fareDetailsBySegment"][0].get("cabin") or cabin
+        yield Route(
+            price_total,
+            _intern(currency),
+            direct,
+            duration_iso,
+            tuple(_parse_segment(seg) for seg in segments),
+            cabin=_intern(cabin),
+            offer=offer if keep_offers else None,
+        )
 
 
 def _mock_offers_json(origin: str, destination: str) -> Dict:
@@ -78,24 +251,130 @@ def _mock_offers_json(origin: str, destination: str) -> Dict:
     }
 
 
-def best_routes(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 10) -> List[Dict]:
+def best_routes(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 10) -> List[Route]:
+    """
+    Finds routes and annotates each with miles_needed from the default award chart and VPM.
+    Taxes are the ESTIMATED_FLIGHT_TAXES_USD default here; the recommender swaps in
+    confirmed taxes for its top picks.
+    Concurrent identical queries share one upstream search and its parsed result;
+    each caller gets its own list of the (shared, read-only) routes.
+    """
+    return best_routes_with_source(origin, destination, departure_date, adults, max_results)[0]
+
+
+def best_routes_with_source(origin: str, destination: str, departure_date: str, adults: int = 1,
+                            max_results: int = 10) -> Tuple[List[Route], str]:
+    """
+    best_routes plus where the offers came from: SOURCE_AMADEUS, or one of
+    DEGRADED_SOURCES when the search failed (or the circuit breaker is open).
+    """
+    key = (origin, destination, departure_date, adults, max_results)
+    routes, source = route_searches.do(key, lambda: _best_routes(origin, destination, departure_date, adults, max_results))
+    return list(routes), source
+
+
+def _best_routes(origin: str, destination: str, departure_date: str, adults: int, max_results: int) -> Tuple[List[Route], str]:
+    source = SOURCE_AMADEUS
+    try:
+        offers = cached_search_flights(origin, destination, departure_date, adults, max_results)
+    except Exception:
+        offers, source = _fallback_offers(origin, destination, departure_date, adults, max_results)
+    SEARCH_SOURCES.inc(source)
+
+    with span("routing.parse_routes"):
+        routes = parse_routes(offers, keep_offers=source != "mock")
+    with span("routing.vpm"):
+        routes = [_annotate(r) for r in routes]
+    with span("routing.sort"):
+        # Rank by best value-per-mile, break ties by lower price
+        routes.sort(key=_rank_key)
+    return routes, source
+
+
+def _fallback_offers(origin: str, destination: str, departure_date: str, adults: int, max_results: int) -> Tuple[Dict, str]:
+    """
+    Best offers available without Amadeus: an expired cache entry, then the newest
+    stored search of any age, and mock offers only as a last resort.
+    """
+    stale = offer_cache.get_stale(search_cache_key(origin, destination, departure_date, adults, max_results))
+    if stale and stale.get("data"):
+        return stale, "stale_cache"
+    try:
+        stored = get_offer_store().latest_offers(origin, destination, departure_date, adults, limit=max_results)
+    except sqlite3.Error:
+        stored = None
+    if stored and stored["data"]:
+        return stored, "stored"
+    return _mock_offers_json(origin, destination), "mock"
+
+
+def stream_best_routes(origin: str, destination: str, departure_date: str, adults: int = 1,
+                       max_results: int = 250, top_k: int = 5, max_offers: Optional[int] = None) -> List[Route]:
     """
-    Finds routes and annotates each with estimated miles_needed and VPM using flight award CPM.
-    Taxes default to $5.60 domestic; in real world vary by market.
+    Memory-bounded best_routes for large searches: offers are parsed as the response
+    streams in and only the best `top_k` routes are kept, so peak memory tracks top_k
+    rather than the payload. Reading stops early only when the caller passes
+    `max_offers` (Amadeus returns offers cheapest first). Bypasses the offer cache,
+    which stores whole payloads. A failed search degrades like best_routes (see
+    _fallback_offers).
+
+    Library-only: the web app, JSON API and ingestion CLI do not call this; it is for
+    scripts that scan large searches and only need the leaders.
     """
+    source = SOURCE_AMADEUS
     try:
-        offers = search_flights(origin, destination, departure_date, adults, max_results)
+        with closing(search_flights_stream(origin, destination, departure_date, adults, max_results)) as offers:
+            # Parsing, VPM and selection interleave as the body streams in, so one span covers them
+            with span("routing.parse_routes"):
+                routes = (_annotate(r) for r in iter_routes(islice(offers, max_offers)))
+                top = heapq.nsmallest(top_k, routes, key=_rank_key)
     except Exception:
-        offers = _mock_offers_json(origin, destination)
-
-    routes = parse_routes(offers)
-    for r in routes:
-        taxes = 5.60  # heuristic default
-        miles_needed = miles_needed_for_value(r["price_total"], FLIGHT_AWARD_CPM, taxes_fees_usd=taxes)
-        vpm = value_per_mile(r["price_total"], miles_needed, taxes)
-        r["estimated_miles_needed"] = miles_needed
-        r["value_per_mile_usd"] = vpm
-        r["value_per_mile_cents"] = round(vpm * 100, 2)
-    # Rank by best value-per-mile, break ties by lower price
-    routes.sort(key=lambda x: (-x["value_per_mile_usd"], x["price_total"]))
-    return routes 
\ No newline at end of file
+        offers, source = _fallback_offers(origin, destination, departure_date, adults, max_results)
+        with span("routing.parse_routes"):
+            routes = parse_routes(offers, keep_offers=source != "mock")
+        with span("routing.vpm"):
+            routes = [_annotate(r) for r in routes]
+        with span("routing.sort"):
+            top = heapq.nsmallest(top_k, routes, key=_rank_key)
+    SEARCH_SOURCES.inc(source)
+    return top
+
+
+def award_miles(r: Route, price_total: float, taxes: float, program: Optional[str] = None) -> Tuple[int, bool]:
+    """
+    Miles the route costs on the program's award chart, and True; for airports outside
+    the distance table, the flat FLIGHT_AWARD_CPM estimate from the cash price, and False.
+    """
+    legs = tuple((seg.departure_airport, seg.arrival_airport) for seg in r.segments)
+    miles = get_award_chart(program).miles_for(legs, r.cabin)
+    if miles is None:
+        return miles_needed_for_value(price_total, FLIGHT_AWARD_CPM, taxes_fees_usd=taxes), False
+    return miles, True
+
+
+def _annotate(r: Route, taxes: float = ESTIMATED_FLIGHT_TAXES_USD) -> Route:
+    miles_needed, _ = award_miles(r, r.price_total, taxes)
+    vpm = value_per_mile(r.price_total, miles_needed, taxes)
+    r.estimated_miles_needed = miles_needed
+    r.value_per_mile_usd = vpm
+    r.value_per_mile_cents = round(vpm * 100, 2)
+    return r
+
+
+def _rank_key(r: Route) -> Tuple[float, float]:
+    return -r.value_per_mile_usd, r.price_total
+
+
+async def best_routes_async(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 10) -> List[Route]:
+    """
+    Awaitable best_routes: runs the cached, coalesced search on the shared Amadeus worker pool.
+    """
+    return await get_async_client().run(best_routes, origin, destination, departure_date, adults, max_results)
+
+
+async def best_routes_with_source_async(origin: str, destination: str, departure_date: str, adults: int = 1,
+                                        max_results: int = 10) -> Tuple[List[Route], str]:
+    """
+    Awaitable best_routes_with_source.
+    """
+    return await get_async_client().run(best_routes_with_source, origin, destination, departure_date, adults, max_results)
@@ -1,13 +1,33 @@
+import atexit
+import json
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import REGISTRY, stats_collector
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = Path("flight_data.db")
+# Stored offers younger than this (seconds) can answer searches; 0 disables
+OFFER_STORE_MAX_AGE = float(os.getenv("OFFER_STORE_MAX_AGE", "1800"))
 
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        """
+# Feedback writer tuning
+FEEDBACK_BUFFERED = os.getenv("FEEDBACK_BUFFERED", "0") == "1"
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "0.5"))
+BUSY_TIMEOUT = 5.0  # seconds to wait on another writer's lock
+# Extra attempts (with doubling back-off) for feedback writes that still hit a locked database
+FEEDBACK_LOCK_RETRIES = int(os.getenv("FEEDBACK_LOCK_RETRIES", "3"))
+FEEDBACK_LOCK_BACKOFF = 0.05  # seconds before the first retry
+
+FEEDBACK_SCHEMA = """
     CREATE TABLE IF NOT EXISTS feedback (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         origin TEXT,
@@ -18,20 +38,500 @@ def get_conn():
         comments TEXT,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
-        """
-    )
+"""
+
+# Incrementally maintained rating aggregates: triggers fold each new rating into
+# per-route and per-miles-bucket running sums, so reads are a primary-key lookup
+MILES_BUCKET_SIZE = 10000
+FEEDBACK_MIN_RATINGS = int(os.getenv("FEEDBACK_MIN_RATINGS", "3"))
+
+FEEDBACK_AGGREGATES_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS feedback_route_stats (
+        origin TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        rating_sum INTEGER NOT NULL,
+        rating_count INTEGER NOT NULL,
+        PRIMARY KEY (origin, destination)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS feedback_miles_stats (
+        miles_bucket INTEGER PRIMARY KEY,
+        rating_sum INTEGER NOT NULL,
+        rating_count INTEGER NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS feedback_stats_after_insert
+    AFTER INSERT ON feedback WHEN NEW.rating BETWEEN 1 AND 5
+    BEGIN
+        INSERT INTO feedback_route_stats (origin, destination, rating_sum, rating_count)
+        SELECT NEW.origin, NEW.destination, NEW.rating, 1
+        WHERE NEW.origin IS NOT NULL AND NEW.destination IS NOT NULL
+        ON CONFLICT (origin, destination) DO UPDATE SET
+            rating_sum = rating_sum + excluded.rating_sum,
+            rating_count = rating_count + 1;
+        INSERT INTO feedback_miles_stats (miles_bucket, rating_sum, rating_count)
+        VALUES ((NEW.miles_available / {MILES_BUCKET_SIZE}) * {MILES_BUCKET_SIZE}, NEW.rating, 1)
+        ON CONFLICT (miles_bucket) DO UPDATE SET
+            rating_sum = rating_sum + excluded.rating_sum,
+            rating_count = rating_count + 1;
+    END;
+"""
+
+FEEDBACK_AGGREGATES_REBUILD = f"""
+    DELETE FROM feedback_route_stats;
+    DELETE FROM feedback_miles_stats;
+    INSERT INTO feedback_route_stats (origin, destination, rating_sum, rating_count)
+        SELECT origin, destination, SUM(rating), COUNT(*) FROM feedback
+        WHERE rating BETWEEN 1 AND 5 AND origin IS NOT NULL AND destination IS NOT NULL
+        GROUP BY origin, destination;
+    INSERT INTO feedback_miles_stats (miles_bucket, rating_sum, rating_count)
+        SELECT (miles_available / {MILES_BUCKET_SIZE}) * {MILES_BUCKET_SIZE}, SUM(rating), COUNT(*) FROM feedback
+        WHERE rating BETWEEN 1 AND 5
+        GROUP BY 1;
+"""
+
+FEEDBACK_INSERT = """
+    INSERT INTO feedback (origin, destination, departure_date, miles_available, rating, comments)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def get_conn():
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute(FEEDBACK_SCHEMA)
     return conn
 
 
-def insert_feedback(origin: str, destination: str, departure_date: str, miles_available: int, rating: int, comments: str):
-    conn = get_conn()
+def _ensure_feedback_schema(conn: sqlite3.Connection) -> None:
     with conn:
-        conn.execute(
+        conn.execute(FEEDBACK_SCHEMA)
+        had_triggers = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'feedback_stats_after_insert'"
+        ).fetchone()
+    if not had_triggers:
+        conn.executescript(FEEDBACK_AGGREGATES_SCHEMA)
+        # Fold in any feedback recorded before the aggregates existed
+        conn.executescript("BEGIN;" + FEEDBACK_AGGREGATES_REBUILD + "COMMIT;")
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class FeedbackWriter:
+    """
+    Feedback inserts without per-request setup: the schema is created once,
+    connections are WAL-mode with a busy timeout and kept per thread.
+
+    With `buffered=True`, insert() only enqueues the row; a background thread
+    writes queued rows in batches of up to `batch_size` (or whatever arrived
+    within `flush_interval`) and drains the queue on close() / interpreter exit.
+    Writes that hit a locked database are retried with back-off; rows that still
+    cannot be written are logged and counted in stats()["rows_dropped"].
+    """
+
+    def __init__(self, path: Path = DB_PATH, buffered: bool = FEEDBACK_BUFFERED,
+                 batch_size: int = FEEDBACK_BATCH_SIZE, flush_interval: float = FEEDBACK_FLUSH_INTERVAL):
+        self.path = Path(path)
+        self.buffered = buffered
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # Orders insert()'s closed check and enqueue against close()'s sentinel
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"rows_written": 0, "batches_written": 0, "rows_dropped": 0, "lock_retries": 0}
+        _ensure_feedback_schema(self._conn())
+        if buffered:
+            self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    @property
+    def rows_written(self) -> int:
+        return self._stats["rows_written"]
+
+    @property
+    def batches_written(self) -> int:
+        return self._stats["batches_written"]
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def insert(self, origin: str, destination: str, departure_date: str, miles_available: int,
+               rating: int, comments: str) -> None:
+        row = (origin, destination, departure_date, miles_available, rating, comments)
+        if self.buffered:
+            with self._lock:
+                if not self._closed:
+                    self._queue.put(row)
+                    return
+        # Unbuffered, or the writer thread has been told to stop: write it ourselves
+        self._write([row])
+
+    def _write(self, rows: List[tuple]) -> None:
+        attempt = 0
+        while True:
+            try:
+                conn = self._conn()
+                with conn:
+                    conn.executemany(FEEDBACK_INSERT, rows)
+                break
+            except sqlite3.OperationalError as exc:
+                # Still locked after BUSY_TIMEOUT (heavy contention): back off and try again
+                message = str(exc)
+                if attempt >= FEEDBACK_LOCK_RETRIES or ("locked" not in message and "busy" not in message):
+                    raise
+                self._count("lock_retries")
+                time.sleep(FEEDBACK_LOCK_BACKOFF * (2 ** attempt))
+                attempt += 1
+        self._count("rows_written", len(rows))
+        self._count("batches_written")
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            row = self._queue.get()
+            if row is None:
+                self._queue.task_done()
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            try:
+                self._write(batch)
+            except sqlite3.Error:
+                # Don't let one bad row kill the writer thread: retry row by row, dropping only failures
+                for row in batch:
+                    try:
+                        self._write([row])
+                    except sqlite3.Error:
+                        self._count("rows_dropped")
+                        logger.exception("dropping feedback row for %s-%s", row[0], row[1])
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """
+        Blocks until every queued row has been written.
+        """
+        if self.buffered:
+            self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+
+_feedback_writer: Optional[FeedbackWriter] = None
+_feedback_writer_lock = threading.Lock()
+
+
+def get_feedback_writer() -> FeedbackWriter:
+    """
+    Returns the process-wide feedback writer, creating the schema on first use.
+    """
+    global _feedback_writer
+    if _feedback_writer is None:
+        with _feedback_writer_lock:
+            if _feedback_writer is None:
+                _feedback_writer = FeedbackWriter()
+                REGISTRY.add_collector(stats_collector("feedback_writer", _feedback_writer.stats, "Feedback writer"))
+    return _feedback_writer
+
+
+class FeedbackAggregates:
+    """
+    Reads the materialized feedback rating aggregates. Each lookup is a
+    primary-key probe on a summary table, independent of feedback volume.
+    """
+
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        _ensure_feedback_schema(self._conn())
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def route_rating(self, origin: str, destination: str) -> Optional[Dict]:
+        """
+        {"avg_rating": ..., "count": ...} for a route, or None if it has no ratings.
+        """
+        row = self._conn().execute(
+            "SELECT rating_sum, rating_count FROM feedback_route_stats WHERE origin = ? AND destination = ?",
+            (origin, destination),
+        ).fetchone()
+        return _rating(row)
+
+    def route_ratings(self, routes: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict]:
+        """
+        route_rating for several (origin, destination) pairs; pairs without ratings are omitted.
+        """
+        ratings = {}
+        for origin, destination in set(routes):
+            rating = self.route_rating(origin, destination)
+            if rating is not None:
+                ratings[(origin, destination)] = rating
+        return ratings
+
+    def miles_bucket_rating(self, miles_available: int) -> Optional[Dict]:
+        bucket = (miles_available // MILES_BUCKET_SIZE) * MILES_BUCKET_SIZE
+        row = self._conn().execute(
+            "SELECT rating_sum, rating_count FROM feedback_miles_stats WHERE miles_bucket = ?", (bucket,)
+        ).fetchone()
+        rating = _rating(row)
+        if rating is not None:
+            rating["miles_bucket"] = bucket
+        return rating
+
+    def rebuild(self) -> None:
+        """
+        Recomputes both summary tables from the raw feedback table (compaction/repair job).
+        """
+        self._conn().executescript("BEGIN IMMEDIATE;" + FEEDBACK_AGGREGATES_REBUILD + "COMMIT;")
+
+
+def _rating(row: Optional[tuple]) -> Optional[Dict]:
+    if row is None or not row[1]:
+        return None
+    return {"avg_rating": round(row[0] / row[1], 2), "count": row[1]}
+
+
+_feedback_aggregates: Optional[FeedbackAggregates] = None
+
+
+def get_feedback_aggregates() -> FeedbackAggregates:
+    """
+    Returns the process-wide feedback aggregates reader.
+    """
+    global _feedback_aggregates
+    if _feedback_aggregates is None:
+        with _feedback_writer_lock:
+            if _feedback_aggregates is None:
+                _feedback_aggregates = FeedbackAggregates()
+    return _feedback_aggregates
+
+
+def insert_feedback(origin: str, destination: str, departure_date: str, miles_available: int, rating: int, comments: str):
+    get_feedback_writer().insert(origin, destination, departure_date, miles_available, rating, comments)
+
+
+class OfferStore:
+    """
+    SQLite store of raw Amadeus flight offers, one row per offer.
+
+    Each search is saved as a batch sharing one `fetched_at`, so the freshest
+    snapshot for a route/date is a single indexed lookup. The schema is set up
+    once per store and every thread keeps its own WAL-mode connection.
+    """
+
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS flight_offers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                departure_date TEXT NOT NULL,
+                adults INTEGER NOT NULL DEFAULT 1,
+                fetched_at REAL NOT NULL,
+                price_total REAL,
+                currency TEXT,
+                carrier_code TEXT,
+                stops INTEGER,
+                offer_json TEXT NOT NULL
+            )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_flight_offers_route "
+                "ON flight_offers (origin, destination, departure_date, adults, fetched_at)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_flight_offers_fetched ON flight_offers (fetched_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def save_offers(self, origin: str, destination: str, departure_date: str, offers: Iterable[Dict],
+                    adults: int = 1, fetched_at: Optional[float] = None) -> int:
+        """
+        Saves one search's offers as a batch. Returns the number of rows written.
+        """
+        return self.save_searches([(origin, destination, departure_date, adults, offers)], fetched_at)
+
+    def save_searches(self, searches: Iterable[Tuple[str, str, str, int, Iterable[Dict]]],
+                      fetched_at: Optional[float] = None) -> int:
+        """
+        Saves many (origin, destination, departure_date, adults, offers) searches in one transaction.
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        rows = [
+            _offer_row(origin, destination, departure_date, adults, fetched_at, offer)
+            for origin, destination, departure_date, adults, offers in searches
+            for offer in offers
+        ]
+        if not rows:
+            return 0
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                """
+            INSERT INTO flight_offers (origin, destination, departure_date, adults, fetched_at,
+                                       price_total, currency, carrier_code, stops, offer_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+        return len(rows)
+
+    def latest_offers(self, origin: str, destination: str, departure_date: str, adults: int = 1,
+                      max_age: Optional[float] = None, limit: Optional[int] = None) -> Optional[Dict]:
+        """
+        Returns the most recent stored search as an offers JSON dict ({"data": [...]}),
+        or None if nothing is stored or the newest batch is older than `max_age` seconds.
+        """
+        conn = self._conn()
+        row = conn.execute(
+            """
+        SELECT MAX(fetched_at) FROM flight_offers
+        WHERE origin = ? AND destination = ? AND departure_date = ? AND adults = ?
+            """,
+            (origin, destination, departure_date, adults),
+        ).fetchone()
+        fetched_at = row[0] if row else None
+        if fetched_at is None or (max_age is not None and time.time() - fetched_at > max_age):
+            return None
+        rows = conn.execute(
             """
-        INSERT INTO feedback (origin, destination, departure_date, miles_available, rating, comments)
-        VALUES (?, ?, ?, ?, ?, ?)
+        SELECT offer_json FROM flight_offers
+        WHERE origin = ? AND destination = ? AND departure_date = ? AND adults = ? AND fetched_at = ?
+        ORDER BY id LIMIT ?
             """,
-            (origin, destination, departure_date, miles_available, rating, comments),
-        )
-    conn.close()
+            (origin, destination, departure_date, adults, fetched_at, -1 if limit is None else limit),
+        ).fetchall()
+        return {"data": [json.loads(r[0]) for r in rows], "meta": {"fetched_at": fetched_at}}
+
+    def iter_offers(self, origin: Optional[str] = None, destination: Optional[str] = None,
+                    departure_date: Optional[str] = None, since: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Yields stored offers oldest first, optionally filtered by route, departure date and
+        fetch time. Rows are read from the cursor as they are consumed, so memory stays
+        flat for bulk exports.
+        """
+        sql = "SELECT offer_json FROM flight_offers WHERE 1 = 1"
+        params: list = []
+        for column, value in (("origin", origin), ("destination", destination), ("departure_date", departure_date)):
+            if value is not None:
+                sql += f" AND {column} = ?"
+                params.append(value)
+        if since is not None:
+            sql += " AND fetched_at >= ?"
+            params.append(since)
+        sql += " ORDER BY id"
+        for (offer_json,) in self._conn().execute(sql, params):
+            yield json.loads(offer_json)
+
+    def price_history(self, origin: str, destination: str, departure_date: Optional[str] = None,
+                      since: Optional[float] = None) -> List[Dict]:
+        """
+        Cheapest stored price per (departure_date, fetch) for a route, oldest fetch first.
+        """
+        sql = """
+        SELECT departure_date, fetched_at, MIN(price_total), currency, COUNT(*) FROM flight_offers
+        WHERE origin = ? AND destination = ?
+        """
+        params: list = [origin, destination]
+        if departure_date is not None:
+            sql += " AND departure_date = ?"
+            params.append(departure_date)
+        if since is not None:
+            sql += " AND fetched_at >= ?"
+            params.append(since)
+        sql += " GROUP BY departure_date, fetched_at ORDER BY departure_date, fetched_at"
+        return [
+            {"departure_date": d, "fetched_at": f, "min_price_total": p, "currency": c, "offers": n}
+            for d, f, p, c, n in self._conn().execute(sql, params)
+        ]
+
+    def prune(self, older_than: float) -> int:
+        """
+        Deletes offers fetched more than `older_than` seconds ago. Returns rows deleted.
+        """
+        conn = self._conn()
+        with conn:
+            cur = conn.execute("DELETE FROM flight_offers WHERE fetched_at < ?", (time.time() - older_than,))
+        return cur.rowcount
+
+
+def _offer_row(origin: str, destination: str, departure_date: str, adults: int, fetched_at: float, offer: Dict) -> tuple:
+    price = offer.get("price", {})
+    try:
+        price_total = float(price.get("total"))
+    except (TypeError, ValueError):
+        price_total = None
+    segments = (offer.get("itineraries") or [{}])[0].get("segments", [])
+    carrier = segments[0].get("carrierCode") if segments else None
+    return (origin, destination, departure_date, adults, fetched_at,
+            price_total, price.get("currency"), carrier, max(len(segments) - 1, 0),
+            json.dumps(offer, separators=(",", ":")))
+
+
+_offer_store: Optional[OfferStore] = None
+_offer_store_lock = threading.Lock()
+
 
+def get_offer_store() -> OfferStore:
+    """
+    Returns the process-wide offer store, creating its schema on first use.
+    """
+    global _offer_store
+    if _offer_store is None:
+        with _offer_store_lock:
+            if _offer_store is None:
+                _offer_store = OfferStore()
+    return _offer_store
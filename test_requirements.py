@@ -1,8 +1,45 @@
 import unittest
 import re
 from value_calc import example_calculations, FLIGHT_AWARD_CPM, HOTEL_CPM, GIFT_CARD_CPM
-from recommender import recommend_best_redemptions
+from recommender import recommend_best_redemptions, recommend_best_redemptions_async, search_queries
 import app as webapp
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest.mock
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from types import SimpleNamespace
+import requests
+import export
+import main as ingestion
+import pricing
+import profiling
+import recommender
+import reference
+import routing
+import value_calc
+from airports import distance_miles
+from award_charts import get_award_chart
+from benchmarks.fixtures import generate_offers
+from benchmarks.stub_amadeus import StubAmadeus
+from metrics import Histogram
+from offer_cache import MemoryBackend, SQLiteBackend, TTLCache, search_cache_key
+from ranking import merge_recommendations, rank_flights
+from reference import AmadeusClient, TokenManager, iter_json_array
+from routing import parse_routes, _mock_offers_json
+from single_flight import SingleFlight
+from sql_lite import OFFER_STORE_MAX_AGE, FeedbackAggregates, FeedbackWriter, OfferStore
 
 
 class RequirementsTest(unittest.TestCase):
@@ -36,6 +73,50 @@ class RequirementsTest(unittest.TestCase):
         values = [r.get('value_per_mile_cents', 0) for r in recs]
         self.assertEqual(values, sorted(values, reverse=True))
 
+    def test_async_recommendation_fans_out_over_dates(self):
+        dates = ['2025-09-01', '2025-09-02', '2025-09-03']
+        res = asyncio.run(recommend_best_redemptions_async(
+            'JFK', 'LAX', dates[0], miles_available=30000, departure_dates=dates))
+        self.assertEqual([s['departure_date'] for s in res['searches']], dates)
+        self.assertTrue(all(s['status'] == 'ok' for s in res['searches']))
+        flights = [r for r in res['recommendations'] if r['type'] == 'flight_award']
+        self.assertEqual(len(flights), 5)
+        values = [r.get('value_per_mile_cents', 0) for r in res['recommendations']]
+        self.assertEqual(values, sorted(values, reverse=True))
+
+    def test_flexible_dates_return_calendar(self):
+        center = date.today() + timedelta(days=30)
+        res = recommend_best_redemptions('JFK', 'LAX', center.isoformat(), miles_available=30000, flex_days=2)
+        days = [d['departure_date'] for d in res['calendar']]
+        self.assertEqual(days, [(center + timedelta(days=n)).isoformat() for n in range(-2, 3)])
+        for day in res['calendar']:
+            self.assertEqual(day['status'], 'ok')
+            self.assertIsNotNone(day['best_value_per_mile_cents'])
+
+    def test_flex_window_starts_no_earlier_than_today(self):
+        today = date(2031, 5, 10)
+        self.assertEqual(recommender.date_window('2031-05-11', 3, today=today),
+                         ['2031-05-10', '2031-05-11', '2031-05-12', '2031-05-13', '2031-05-14'])
+        self.assertEqual(recommender.date_window('2031-05-01', 2, today=today), ['2031-05-01'])
+
+    def test_sync_recommendation_works_inside_an_event_loop(self):
+        center = (date.today() + timedelta(days=30)).isoformat()
+
+        async def caller():
+            return recommend_best_redemptions('JFK', 'LAX', center, miles_available=30000, flex_days=1)
+
+        self.assertEqual(len(asyncio.run(caller())['calendar']), 3)
+
+    def test_metro_code_expands_to_all_airports(self):
+        self.assertEqual(search_queries('NYC', 'LAX', '2025-09-01'),
+                         [('JFK', 'LAX', '2025-09-01'), ('LGA', 'LAX', '2025-09-01'), ('EWR', 'LAX', '2025-09-01')])
+        res = recommend_best_redemptions('NYC', 'LAX', '2025-09-01', miles_available=30000)
+        self.assertEqual([s['origin'] for s in res['searches']], ['JFK', 'LGA', 'EWR'])
+        self.assertTrue(all(s['status'] == 'ok' for s in res['searches']))
+        # Mock data returns the same two itineraries for every pair; they are merged once
+        flights = [r for r in res['recommendations'] if r['type'] == 'flight_award']
+        self.assertEqual(len(flights), 2)
+
     def test_web_endpoints(self):
         app = webapp.app
         app.testing = True
@@ -46,6 +127,12 @@ class RequirementsTest(unittest.TestCase):
         self.assertEqual(r.status_code, 200)
         self.assertIn(b'Redemption Optimizer', r.data)
 
+        # Landing page revalidates with ETag / Last-Modified
+        etag = r.headers['ETag']
+        self.assertIn('Last-Modified', r.headers)
+        r = client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 304)
+
         # POST /recommend
         r = client.post('/recommend', data={
             'origin': 'JFK',
@@ -56,6 +143,29 @@ class RequirementsTest(unittest.TestCase):
         self.assertEqual(r.status_code, 200)
         self.assertRegex(r.data.decode('utf-8'), re.compile(r'Top\s+recommendations', re.IGNORECASE))
 
+        center = date.today() + timedelta(days=30)
+        r = client.post('/recommend', data={
+            'origin': 'JFK',
+            'destination': 'LAX',
+            'departure_date': center.isoformat(),
+            'miles_available': '25000',
+            'flex_days': '1',
+        })
+        self.assertEqual(r.status_code, 200)
+        self.assertIn((center + timedelta(days=1)).isoformat().encode(), r.data)
+
+        # A malformed date re-renders the form with a message instead of failing
+        r = client.post('/recommend', data={
+            'origin': 'JFK',
+            'destination': 'LAX',
+            'departure_date': '2025-13-40',
+            'miles_available': '25000',
+            'flex_days': '1',
+        })
+        self.assertEqual(r.status_code, 400)
+        self.assertIn(b'Departure date must be a valid date', r.data)
+        self.assertIn(b'value="2025-13-40"', r.data)
+
         # POST /feedback
         r = client.post('/feedback', data={
             'origin': 'JFK',
@@ -69,5 +179,927 @@ class RequirementsTest(unittest.TestCase):
         self.assertIn(b'Thanks for your feedback', r.data)
 
 
+class RecommendApiTest(unittest.TestCase):
+    def setUp(self):
+        webapp.app.testing = True
+        self.client = webapp.app.test_client()
+        self.key = search_cache_key('SEA', 'LAX', '2025-09-01', 1, 10)
+        routing.offer_cache.put(self.key, _mock_offers_json('SEA', 'LAX'))
+
+    def tearDown(self):
+        routing.offer_cache.invalidate(self.key)
+
+    def test_json_response_with_field_selection_and_gzip(self):
+        url = '/api/recommend?origin=SEA&destination=LAX&departure_date=2025-09-01&miles_available=30000&omit=segments'
+        r = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.headers['Content-Encoding'], 'gzip')
+        self.assertIn('public', r.headers['Cache-Control'])
+        data = json.loads(gzip.decompress(r.data))
+        flights = [rec for rec in data['recommendations'] if rec['type'] == 'flight_award']
+        self.assertTrue(flights)
+        self.assertTrue(all('segments' not in f for f in flights))
+
+        r = self.client.get(url, headers={'If-None-Match': r.headers['ETag']})
+        self.assertEqual(r.status_code, 304)
+
+        # A refreshed search changes the ETag
+        etag = r.headers['ETag']
+        time.sleep(0.01)
+        routing.offer_cache.put(self.key, _mock_offers_json('SEA', 'LAX'))
+        r = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 200)
+
+    def test_etag_follows_ratings_and_confirmed_prices(self):
+        url = '/api/recommend?origin=SEA&destination=LAX&departure_date=2025-09-01&miles_available=30000'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feedback.db')
+            writer, aggregates = FeedbackWriter(path, buffered=False), FeedbackAggregates(path)
+            with unittest.mock.patch.object(webapp, 'get_feedback_aggregates', return_value=aggregates):
+                etag = self.client.get(url).headers['ETag']
+                r = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(r.status_code, 304)
+                self.assertIn('Accept-Encoding', r.headers['Vary'])
+
+                writer.insert('SEA', 'LAX', '2025-09-01', 30000, 5, '')
+                r = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(r.status_code, 200)
+                etag = r.headers['ETag']
+
+                route = routing.cached_routes('SEA', 'LAX', '2025-09-01')[0]
+                pricing.priced_offers.put(pricing.pricing_key(route), {'price_total': 310.0, 'taxes_usd': 30.0})
+                r = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(r.status_code, 200)
+                self.assertLessEqual(r.cache_control.max_age, int(pricing.priced_offers.ttl))
+                pricing.priced_offers.invalidate(pricing.pricing_key(route))
+
+    def test_missing_parameters(self):
+        r = self.client.get('/api/recommend?origin=SEA')
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('error', r.get_json())
+
+    def test_invalid_departure_date(self):
+        r = self.client.get('/api/recommend?origin=SEA&destination=LAX&departure_date=next-friday&flex_days=2')
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('departure_date', r.get_json()['error'])
+
+
+class TokenManagerTest(unittest.TestCase):
+    def test_token_is_minted_once_for_concurrent_callers(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {'access_token': 'tok-%d' % len(calls), 'expires_in': 1799}
+
+        manager = TokenManager(fetch=fetch, background=False)
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(manager.get_token())) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(set(tokens), {'tok-1'})
+
+        # A token rejected by the API is dropped and minted again
+        manager.invalidate()
+        self.assertEqual(manager.get_token(), 'tok-2')
+
+    def test_token_inside_refresh_margin_is_renewed_once(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {'access_token': 'tok-%d' % len(calls), 'expires_in': 0.5}
+
+        # Fresh for 0.1s, then inside the 0.4s margin while still valid upstream
+        manager = TokenManager(fetch=fetch, refresh_margin=0.4, background=False)
+        self.assertEqual(manager.get_token(), 'tok-1')
+        self.assertEqual(manager.get_token(), 'tok-1')
+        time.sleep(0.15)
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(manager.get_token())) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(set(tokens), {'tok-2'})
+        self.assertEqual(len(calls), 2)
+
+    def test_background_refresher_renews_before_expiry_and_stops(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {'access_token': 'tok-%d' % len(calls), 'expires_in': 1.0}
+
+        with unittest.mock.patch.object(reference, 'TOKEN_RETRY_INTERVAL', 0.01):
+            manager = TokenManager(fetch=fetch, refresh_margin=0.2)
+            started = time.monotonic()
+            self.assertEqual(manager.get_token(), 'tok-1')
+            # The refresher renews two margins ahead (~0.6s); callers would only refresh at 0.8s
+            while manager.refresh_count < 2 and time.monotonic() - started < 2:
+                time.sleep(0.01)
+            self.assertLess(time.monotonic() - started, 0.8)
+            self.assertEqual(manager.get_token(), 'tok-2')
+            self.assertEqual(len(calls), 2)
+
+            manager.stop()
+            manager._refresher.join(timeout=1)
+            self.assertFalse(manager._refresher.is_alive())
+
+
+class AmadeusClientTest(unittest.TestCase):
+    def setUp(self):
+        self.statuses = [429, 200, 200]
+
+        test = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status = test.statuses.pop(0)
+                body = json.dumps({'data': []}).encode()
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.original_url = reference.OFFERS_URL
+        reference.OFFERS_URL = 'http://127.0.0.1:%d/v2/shopping/flight-offers' % self.server.server_port
+
+    def tearDown(self):
+        reference.OFFERS_URL = self.original_url
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_rate_limit_and_reuses_connection(self):
+        tokens = TokenManager(fetch=lambda: {'access_token': 't', 'expires_in': 1799}, background=False)
+        client = AmadeusClient(client_id='id', client_secret='secret', token_manager=tokens)
+        self.assertEqual(client.search_flights('JFK', 'LAX', '2025-09-01'), {'data': []})
+        self.assertEqual(client.search_flights('JFK', 'LAX', '2025-09-01'), {'data': []})
+        stats = client.stats()
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['rate_limited'], 1)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 2)
+        client.close()
+
+
+class StreamingParseTest(unittest.TestCase):
+    def test_offers_are_yielded_across_chunk_boundaries(self):
+        offers = _mock_offers_json('JFK', 'LAX')['data']
+        doc = json.dumps({'meta': {'count': 2, 'links': {'self': 'x'}}, 'data': offers,
+                          'dictionaries': {'carriers': {'AA': 'AMERICAN'}}}).encode()
+        for size in (1, 7, 64, len(doc)):
+            chunks = [doc[i:i + size] for i in range(0, len(doc), size)]
+            self.assertEqual(list(iter_json_array(chunks, 'data')), offers)
+
+    def test_reading_stops_at_end_of_array(self):
+        head = json.dumps({'data': [{'id': 1}, {'id': 2.5}]})[:-1].encode()
+
+        def chunks():
+            yield head
+            yield b', "dictionaries": {'
+            raise AssertionError('read past the data array')
+
+        self.assertEqual(list(iter_json_array(chunks(), 'data')), [{'id': 1}, {'id': 2.5}])
+
+
+class OfferCacheTest(unittest.TestCase):
+    def check_backend(self, backend):
+        cache = TTLCache(backend, ttl=60)
+        loads = []
+
+        def loader(value):
+            def load():
+                loads.append(value)
+                return {'data': [value]}
+            return load
+
+        self.assertEqual(cache.get_or_load('a', loader('a')), {'data': ['a']})
+        self.assertEqual(cache.get_or_load('a', loader('a')), {'data': ['a']})
+        cache.get_or_load('b', loader('b'))
+        cache.get_or_load('a', loader('a'))
+        cache.get_or_load('c', loader('c'))  # evicts least recently used 'b'
+        cache.get_or_load('b', loader('b'))
+        self.assertEqual(loads, ['a', 'b', 'c', 'b'])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (2, 4, 2, 2))
+
+    def test_memory_backend(self):
+        self.check_backend(MemoryBackend(maxsize=2))
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.check_backend(SQLiteBackend(os.path.join(tmp, 'cache.db'), maxsize=2))
+
+    def test_stale_entries_are_served_while_refreshing(self):
+        cache = TTLCache(MemoryBackend(), ttl=60, stale_ttl=600)
+        cache.backend.set('k', time.time() - 120, 'old')
+        refreshed = threading.Event()
+
+        def loader():
+            refreshed.set()
+            return 'new'
+
+        self.assertEqual(cache.get_or_load('k', loader), 'old')
+        self.assertTrue(refreshed.wait(2))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def run_concurrently(self, flight, fn, n=10):
+        results, errors = [], []
+        release = threading.Event()
+
+        def slow():
+            release.wait(2)
+            return fn()
+
+        def worker():
+            try:
+                results.append(flight.do('JFK-ORD', slow))
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for t in threads:
+            t.start()
+        while flight.stats()['calls'] < n:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        results, errors = self.run_concurrently(flight, lambda: {'data': []})
+        self.assertEqual(len(results), 10)
+        self.assertFalse(errors)
+        self.assertEqual(flight.stats()['executions'], 1)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise RuntimeError('upstream down')
+
+        results, errors = self.run_concurrently(flight, fail)
+        self.assertFalse(results)
+        self.assertEqual(len(errors), 10)
+        self.assertEqual(flight.stats()['executions'], 1)
+
+
+class RoutingTest(unittest.TestCase):
+    def test_parse_routes_builds_compact_routes(self):
+        routes = parse_routes(_mock_offers_json('JFK', 'LAX'))
+        self.assertEqual([r.direct for r in routes], [True, False])
+        self.assertFalse(hasattr(routes[0], '__dict__'))
+        connecting = routes[1]
+        self.assertIs(connecting.segments[0].arrival_airport, connecting.segments[1].departure_airport)
+        exported = connecting.to_dict()
+        self.assertEqual(exported['price_total'], 280.0)
+        self.assertEqual(exported['segments'][1]['departure'], {'iataCode': 'ORD', 'at': '2025-09-01T12:00:00'})
+
+    def test_stream_best_routes_keeps_top_k_and_degrades_like_best_routes(self):
+        payload = generate_offers(40, segments=2, seed=3)
+        full = sorted((routing._annotate(r) for r in parse_routes(payload)), key=routing._rank_key)
+        with unittest.mock.patch.object(routing, 'search_flights_stream', return_value=(o for o in payload['data'])):
+            top = routing.stream_best_routes('JFK', 'LAX', '2025-09-01', top_k=5)
+        self.assertEqual(top, full[:5])
+        self.assertTrue(all(r.offer is not None for r in top))
+
+        def failing(*args):
+            raise requests.ConnectionError('upstream down')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OfferStore(os.path.join(tmp, 'offers.db'))
+            store.save_offers('JFK', 'LAX', '2031-02-01', payload['data'][:3], fetched_at=time.time() - 86400)
+            with unittest.mock.patch.multiple(routing, search_flights_stream=failing,
+                                              get_offer_store=unittest.mock.DEFAULT) as patched:
+                patched['get_offer_store'].return_value = store
+                stored = routing.SEARCH_SOURCES.value('stored')
+                top = routing.stream_best_routes('JFK', 'LAX', '2031-02-01', top_k=5)
+                self.assertEqual(len(top), 3)
+                self.assertEqual(routing.SEARCH_SOURCES.value('stored'), stored + 1)
+                mock = routing.SEARCH_SOURCES.value('mock')
+                top = routing.stream_best_routes('JFK', 'LAX', '2031-02-02', top_k=5)
+                self.assertTrue(top and all(r.offer is None for r in top))
+                self.assertEqual(routing.SEARCH_SOURCES.value('mock'), mock + 1)
+
+
+class AwardChartTest(unittest.TestCase):
+    def test_distance_and_zone_charts(self):
+        self.assertEqual(distance_miles('JFK', 'LAX'), 2470)
+        self.assertEqual(distance_miles('LAX', 'JFK'), 2470)
+        self.assertIsNone(distance_miles('JFK', 'ZZZ'))
+        avios = get_award_chart('avios')
+        self.assertEqual(avios.miles_for([('JFK', 'LAX')]), 13000)
+        self.assertEqual(avios.miles_for([('JFK', 'LHR')], 'BUSINESS'), 50000)
+        united = get_award_chart('mileageplus')
+        self.assertEqual(united.miles_for([('JFK', 'BOS')]), 10000)
+        self.assertEqual(united.miles_for([('JFK', 'ORD'), ('ORD', 'LAX')]), 12500)
+        with self.assertRaises(KeyError):
+            get_award_chart('nope')
+
+    def test_routes_are_priced_per_segment_with_cpm_fallback(self):
+        direct, connecting = parse_routes(_mock_offers_json('JFK', 'LAX'))
+        self.assertEqual(routing.award_miles(direct, direct.price_total, 5.60), (13000, True))
+        # Avios prices each flight, so the cheaper connection costs more miles
+        self.assertEqual(routing.award_miles(connecting, connecting.price_total, 5.60), (20000, True))
+        self.assertEqual(routing.award_miles(connecting, connecting.price_total, 5.60, 'mileageplus'), (12500, True))
+        unknown, _ = parse_routes(_mock_offers_json('JFK', 'ZZZ'))
+        miles, charted = routing.award_miles(unknown, unknown.price_total, 5.60)
+        self.assertFalse(charted)
+        self.assertEqual(miles, value_calc.miles_needed_for_value(unknown.price_total, FLIGHT_AWARD_CPM, 5.60))
+
+    def test_recommendations_use_the_requested_program(self):
+        res = recommend_best_redemptions('JFK', 'LAX', '2025-09-01', 30000, program='mileageplus')
+        self.assertEqual(res['assumptions']['award_program'], 'mileageplus')
+        flights = [r for r in res['recommendations'] if r['type'] == 'flight_award']
+        self.assertTrue(all(f['estimated_miles_needed'] == 12500 and f['miles_from_award_chart'] for f in flights))
+        client = webapp.app.test_client()
+        r = client.get('/api/recommend?origin=JFK&destination=LAX&departure_date=2025-09-01&program=nope')
+        self.assertEqual(r.status_code, 400)
+
+
+class OfferStoreTest(unittest.TestCase):
+    def test_latest_batch_and_price_history(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OfferStore(os.path.join(tmp, 'offers.db'))
+            offers = _mock_offers_json('JFK', 'ORD')['data']
+            now = time.time()
+            self.assertEqual(store.save_offers('JFK', 'ORD', '2025-09-01', offers[:1], fetched_at=now - 7200), 1)
+            self.assertEqual(store.save_offers('JFK', 'ORD', '2025-09-01', offers, fetched_at=now - 60), 2)
+
+            latest = store.latest_offers('JFK', 'ORD', '2025-09-01', max_age=600)
+            self.assertEqual(latest['data'], offers)
+            self.assertEqual(len(store.latest_offers('JFK', 'ORD', '2025-09-01', limit=1)['data']), 1)
+            self.assertIsNone(store.latest_offers('JFK', 'ORD', '2025-09-01', max_age=30))
+            self.assertIsNone(store.latest_offers('JFK', 'LAX', '2025-09-01'))
+
+            history = store.price_history('JFK', 'ORD')
+            self.assertEqual([h['min_price_total'] for h in history], [320.0, 280.0])
+            self.assertEqual(store.prune(3600), 1)
+
+    def test_store_answers_keep_fetch_time_and_write_errors_keep_live_offers(self):
+        offers = _mock_offers_json('BOS', 'MIA')
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OfferStore(os.path.join(tmp, 'offers.db'))
+            with unittest.mock.patch.object(routing, 'get_offer_store', return_value=store):
+                # A stored search is cached for the TTL, or only until it passes the store's max age
+                ttl = routing.offer_cache.ttl
+                for day, age, fresh_for in (('2031-03-01', ttl + 60, ttl), ('2031-03-03', OFFER_STORE_MAX_AGE - 100, 100)):
+                    store.save_offers('BOS', 'MIA', day, offers['data'], fetched_at=time.time() - age)
+                    self.assertEqual(routing.cached_search_flights('BOS', 'MIA', day)['data'], offers['data'])
+                    stored_at = routing.search_stored_at('BOS', 'MIA', day)
+                    self.assertAlmostEqual(stored_at + ttl - time.time(), fresh_for, delta=2)
+                    with unittest.mock.patch.object(store, 'latest_offers', side_effect=AssertionError('cache miss')):
+                        routing.cached_search_flights('BOS', 'MIA', day)
+                    routing.offer_cache.invalidate(search_cache_key('BOS', 'MIA', day, 1, 10))
+
+                with unittest.mock.patch.object(routing, 'search_flights', return_value=offers), \
+                        unittest.mock.patch.object(store, 'save_offers',
+                                                   side_effect=sqlite3.OperationalError('database is locked')):
+                    with self.assertLogs('routing', 'ERROR'):
+                        self.assertIs(routing.stored_or_search_flights('BOS', 'MIA', '2031-03-02'), offers)
+
+
+class ExportTest(unittest.TestCase):
+    def test_streaming_export_matches_report_and_formats(self):
+        offers = _mock_offers_json('JFK', 'LAX')['data']
+        report = reference.simplify_data(reference.simplify_offers({'data': offers}))
+        self.assertTrue(report.startswith('Route 1: Direct flight\n\n  Segment 1: JFK --> LAX\n'))
+        self.assertIn('Route 2: Connecting flight with 2 segments', report)
+        self.assertIn('Departure: September 01, 2025 at 09:15 AM from JFK', report)
+        out = io.StringIO()
+        self.assertEqual(export.write_export(offers, out, 'text', chunk_size=10), len(report))
+        self.assertEqual(out.getvalue(), report)
+
+        rows = list(csv.reader(io.StringIO(''.join(export.iter_export(offers, 'csv')))))
+        self.assertEqual(tuple(rows[0]), export.CSV_COLUMNS)
+        self.assertEqual([r[:3] for r in rows[1:]], [['1', '1', '1'], ['2', '1', '2'], ['2', '2', '2']])
+        routes = [json.loads(line) for line in ''.join(export.iter_export(offers, 'ndjson')).splitlines()]
+        self.assertEqual([len(r['segments']) for r in routes], [1, 2])
+        with self.assertRaises(ValueError):
+            export.iter_export(offers, 'xml')
+
+    def test_export_endpoint_streams_stored_offers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OfferStore(os.path.join(tmp, 'offers.db'))
+            store.save_offers('JFK', 'LAX', '2025-09-01', _mock_offers_json('JFK', 'LAX')['data'])
+            store.save_offers('SEA', 'LAX', '2025-09-01', _mock_offers_json('SEA', 'LAX')['data'])
+            self.assertEqual(len(list(store.iter_offers('SEA'))), 2)
+            client = webapp.app.test_client()
+            with unittest.mock.patch.object(webapp, 'get_offer_store', return_value=store):
+                r = client.get('/api/export?format=ndjson&origin=jfk')
+                self.assertTrue(r.is_streamed)
+                self.assertEqual(r.mimetype, 'application/x-ndjson')
+                self.assertEqual(len(r.data.splitlines()), 2)
+                self.assertIn('attachment', r.headers['Content-Disposition'])
+                self.assertEqual(client.get('/api/export?format=xml').status_code, 400)
+
+
+class FeedbackWriterTest(unittest.TestCase):
+    def test_buffered_writes_are_batched_and_flushed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feedback.db')
+            writer = FeedbackWriter(path, buffered=True, batch_size=50, flush_interval=0.05)
+
+            def submit():
+                for i in range(100):
+                    writer.insert('JFK', 'LAX', '2025-09-01', 25000, 1 + i % 5, 'ok')
+
+            threads = [threading.Thread(target=submit) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            writer.close()
+
+            self.assertEqual(writer.rows_written, 400)
+            self.assertLess(writer.batches_written, 400)
+            with sqlite3.connect(path) as conn:
+                self.assertEqual(conn.execute('SELECT COUNT(*) FROM feedback').fetchone()[0], 400)
+
+    def test_locked_writes_are_retried_and_dropped_rows_are_logged_and_counted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feedback.db')
+            writer = FeedbackWriter(path, buffered=True, batch_size=10, flush_interval=0.01)
+            errors = [sqlite3.OperationalError('database is locked')] * 2
+
+            class FlakyConnection:
+                def __init__(self, conn):
+                    self.conn = conn
+
+                def __enter__(self):
+                    return self.conn.__enter__()
+
+                def __exit__(self, *exc):
+                    return self.conn.__exit__(*exc)
+
+                def executemany(self, sql, rows):
+                    if errors:
+                        raise errors.pop(0)
+                    return self.conn.executemany(sql, rows)
+
+            real_conn = writer._conn
+            with unittest.mock.patch.object(writer, '_conn', lambda: FlakyConnection(real_conn())), \
+                    unittest.mock.patch('sql_lite.FEEDBACK_LOCK_BACKOFF', 0.001):
+                writer.insert('JFK', 'LAX', '2025-09-01', 25000, 5, 'ok')
+                writer.flush()
+                self.assertEqual(writer.stats()['lock_retries'], 2)
+                self.assertEqual(writer.rows_written, 1)
+
+                # A failure that is not a lock is not retried; the row is logged and counted as dropped
+                errors.extend([sqlite3.OperationalError('disk I/O error')] * 2)
+                with self.assertLogs('sql_lite', 'ERROR'):
+                    writer.insert('JFK', 'LAX', '2025-09-01', 25000, 4, 'ok')
+                    writer.flush()
+            writer.close()
+            self.assertEqual(writer.stats()['rows_dropped'], 1)
+            self.assertEqual(writer.rows_written, 1)
+
+    def test_row_inserted_while_closing_is_not_lost(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feedback.db')
+            writer = FeedbackWriter(path, buffered=True, batch_size=10, flush_interval=0.01)
+            real_put = writer._queue.put
+            in_put, sentinel_queued = threading.Event(), threading.Event()
+
+            def put(row):
+                if row is None:
+                    sentinel_queued.set()
+                else:
+                    # Give close() the chance to queue its sentinel ahead of this row
+                    in_put.set()
+                    sentinel_queued.wait(timeout=0.3)
+                real_put(row)
+
+            with unittest.mock.patch.object(writer._queue, 'put', put):
+                inserter = threading.Thread(target=writer.insert, args=('JFK', 'LAX', '2025-09-01', 25000, 5, 'ok'))
+                inserter.start()
+                in_put.wait()
+                writer.close()
+                inserter.join()
+
+            with sqlite3.connect(path) as conn:
+                self.assertEqual(conn.execute('SELECT COUNT(*) FROM feedback').fetchone()[0], 1)
+
+
+class FeedbackAggregatesTest(unittest.TestCase):
+    def test_aggregates_follow_inserts_and_match_rebuild(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feedback.db')
+            writer = FeedbackWriter(path, buffered=False)
+            for rating, miles in [(5, 25000), (4, 28000), (3, 12000), (0, 12000)]:
+                writer.insert('JFK', 'LAX', '2025-09-01', miles, rating, '')
+            writer.insert('SEA', 'LAX', '2025-09-01', 25000, 2, '')
+
+            aggregates = FeedbackAggregates(path)
+            self.assertEqual(aggregates.route_rating('JFK', 'LAX'), {'avg_rating': 4.0, 'count': 3})
+            self.assertIsNone(aggregates.route_rating('BOS', 'MSY'))
+            self.assertEqual(aggregates.miles_bucket_rating(21000),
+                             {'avg_rating': 3.67, 'count': 3, 'miles_bucket': 20000})
+
+            before = aggregates.route_ratings([('JFK', 'LAX'), ('SEA', 'LAX'), ('BOS', 'MSY')])
+            aggregates.rebuild()
+            self.assertEqual(aggregates.route_ratings([('JFK', 'LAX'), ('SEA', 'LAX'), ('BOS', 'MSY')]), before)
+            self.assertEqual(set(before), {('JFK', 'LAX'), ('SEA', 'LAX')})
+
+    def test_feedback_without_route_is_kept_out_of_route_stats(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feedback.db')
+            writer = FeedbackWriter(path, buffered=False)
+            writer.insert(None, 'LAX', '2025-09-01', 25000, 4, '')
+            writer.insert('JFK', None, '2025-09-01', 25000, 2, '')
+            self.assertEqual(writer.rows_written, 2)
+
+            aggregates = FeedbackAggregates(path)
+            self.assertEqual(aggregates.miles_bucket_rating(25000)['count'], 2)
+            with sqlite3.connect(path) as conn:
+                self.assertEqual(conn.execute('SELECT COUNT(*) FROM feedback_route_stats').fetchone()[0], 0)
+            aggregates.rebuild()
+            self.assertEqual(aggregates.miles_bucket_rating(25000)['count'], 2)
+
+    def test_ratings_are_applied_before_choosing_offers_to_price(self):
+        aggregates = SimpleNamespace(route_ratings=lambda pairs: {('SEA', 'PDX'): {'avg_rating': 4.5, 'count': 9}})
+        seen = []
+        real_rank_flights = recommender.rank_flights
+
+        def rank_flights(candidates, k):
+            seen.append([c.route_rating for c in candidates])
+            return real_rank_flights(candidates, k)
+
+        with unittest.mock.patch.multiple(recommender, get_feedback_aggregates=lambda: aggregates,
+                                          rank_flights=rank_flights):
+            recommend_best_redemptions('SEA', 'PDX', '2031-04-01', miles_available=30000)
+        # Both the pricing pick and the final ranking see the rating
+        self.assertEqual(len(seen), 2)
+        self.assertTrue(all(ratings and set(ratings) == {4.5} for ratings in seen))
+
+    def test_metro_search_feedback_is_rated_per_airport(self):
+        webapp.app.testing = True
+        client = webapp.app.test_client()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'feedback.db')
+            writer = FeedbackWriter(path, buffered=False)
+            with unittest.mock.patch('sql_lite.get_feedback_writer', return_value=writer):
+                r = client.post('/recommend', data={'origin': 'NYC', 'destination': 'LAX',
+                                                    'departure_date': '2025-09-01', 'miles_available': '25000'})
+                rated = re.search(rb'name="rated_origin" value="(\w+)"', r.data).group(1).decode()
+                self.assertIn(rated, ('JFK', 'LGA', 'EWR'))
+                for rating in (5, 4, 5):
+                    client.post('/feedback', data={'origin': 'NYC', 'destination': 'LAX', 'rated_origin': rated,
+                                                   'rated_destination': 'LAX', 'departure_date': '2025-09-01',
+                                                   'miles_available': '25000', 'rating': str(rating)})
+            self.assertEqual(FeedbackAggregates(path).route_rating(rated, 'LAX'), {'avg_rating': 4.67, 'count': 3})
+
+
+class IngestionTest(unittest.TestCase):
+    def test_ingest_batches_writes_and_resumes_from_checkpoint(self):
+        calls = []
+
+        class FakeClient:
+            def search_flights(self, origin, destination, departure_date, adults, max_results):
+                calls.append((origin, destination, departure_date))
+                if departure_date == '2025-09-02' and len(calls) <= 4:
+                    raise RuntimeError('upstream 500')
+                return _mock_offers_json(origin, destination)
+
+            def stats(self):
+                return {}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OfferStore(os.path.join(tmp, 'offers.db'))
+            checkpoint = Path(tmp) / 'checkpoint.log'
+            searches = [(o, d, day) for o, d in [('JFK', 'ORD'), ('SEA', 'LAX')]
+                        for day in ingestion.date_range('2025-09-01', '2025-09-02')]
+
+            report = ingestion.ingest(FakeClient(), store, searches, 1, 5, 1, 1, checkpoint)
+            self.assertEqual((report['searched'], report['failed'], report['rows']), (2, 2, 4))
+
+            # Second run only retries the two failed searches
+            report = ingestion.ingest(FakeClient(), store, searches, 1, 5, 2, 10, checkpoint)
+            self.assertEqual((report['skipped'], report['searched'], report['rows']), (2, 2, 4))
+            self.assertEqual(len(calls), 6)
+            self.assertEqual(len(store.price_history('SEA', 'LAX')), 2)
+
+    def test_checkpoint_log_appends_and_compacts_on_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'checkpoint.log'
+            ingestion.append_checkpoint(path, ['JFK|ORD|2025-09-01|1', 'JFK|ORD|2025-09-02|1'])
+            ingestion.append_checkpoint(path, ['JFK|ORD|2025-09-01|1'])
+            with open(path, 'a') as f:
+                f.write('JFK|ORD|2025-0')  # torn by a crash mid-write
+            self.assertEqual(ingestion.load_checkpoint(path), {'JFK|ORD|2025-09-01|1', 'JFK|ORD|2025-09-02|1'})
+            self.assertEqual(path.read_text(), 'JFK|ORD|2025-09-01|1\nJFK|ORD|2025-09-02|1\n')
+
+            legacy = Path(tmp) / 'checkpoint.json'
+            legacy.write_text(json.dumps({'completed': ['SEA|LAX|2025-09-01|1']}))
+            self.assertEqual(ingestion.load_checkpoint(legacy), {'SEA|LAX|2025-09-01|1'})
+
+    def test_rate_must_be_positive(self):
+        for rate in (0, -1):
+            with self.assertRaises(ValueError):
+                reference.TokenBucket(rate)
+            with self.assertRaises(argparse.ArgumentTypeError):
+                ingestion.positive_float(str(rate))
+        self.assertEqual(ingestion.positive_float('2.5'), 2.5)
+
+    def test_ingest_bounds_submissions_and_saves_progress_on_interrupt(self):
+        submitted = []
+
+        class FakeClient:
+            def search_flights(self, origin, destination, departure_date, adults, max_results):
+                return _mock_offers_json(origin, destination)
+
+            def stats(self):
+                return {}
+
+        real_wait = ingestion.wait
+
+        def interrupt_on_third_wait(in_flight, **kwargs):
+            submitted.append(len(in_flight))
+            if len(submitted) == 3:
+                raise KeyboardInterrupt
+            return real_wait(in_flight, **kwargs)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OfferStore(os.path.join(tmp, 'offers.db'))
+            checkpoint = Path(tmp) / 'checkpoint.log'
+            searches = [('JFK', 'ORD', day) for day in ingestion.date_range('2025-09-01', '2025-09-30')]
+            with unittest.mock.patch.object(ingestion, 'wait', interrupt_on_third_wait):
+                report = ingestion.ingest(FakeClient(), store, searches, 1, 5, 2, 100, checkpoint)
+            self.assertTrue(report['interrupted'])
+            self.assertTrue(all(n <= 4 for n in submitted))
+            # Results consumed before Ctrl-C were written and checkpointed despite the large batch size
+            self.assertGreater(report['searched'], 0)
+            self.assertEqual(len(ingestion.load_checkpoint(checkpoint)), report['searched'])
+            self.assertEqual(report['rows'], 2 * report['searched'])
+
+    def test_malformed_route_lines_are_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'routes.csv'
+            path.write_text('# origin,destination\nJFK,ORD,Chicago\n\nSEA\n  \nbos,msy\n,LAX\n')
+            with unittest.mock.patch('sys.stderr', new_callable=io.StringIO) as err:
+                routes = ingestion.load_routes(path)
+            self.assertEqual(routes, [('JFK', 'ORD', 'Chicago'), ('BOS', 'MSY', 'BOS to MSY')])
+            self.assertEqual(err.getvalue().count('skipping malformed route'), 2)
+
+
+class RankingTest(unittest.TestCase):
+    def test_heap_ranking_matches_full_sort(self):
+        rng = random.Random(3)
+        for affordable_share in (0.0, 0.2, 1.0):
+            candidates = [SimpleNamespace(
+                value_per_mile_cents=rng.choice([1.1, 1.2, 1.3]),
+                price_total=rng.choice([199.0, 250.0, 320.0]),
+                affordable=rng.random() < affordable_share,
+                route_rating=rng.choice([0.0, 0.0, 3.5, 4.8]),
+            ) for _ in range(500)]
+            pool = [c for c in candidates if c.affordable] or candidates
+            expected = sorted(pool, key=lambda c: (-c.value_per_mile_cents, -c.route_rating, c.price_total))[:5]
+            self.assertEqual([id(c) for c in rank_flights(candidates, 5)], [id(c) for c in expected])
+
+    def test_merge_keeps_flights_first_on_ties(self):
+        flights = [{'type': 'flight_award', 'value_per_mile_cents': 1.3},
+                   {'type': 'flight_award', 'value_per_mile_cents': 0.7}]
+        comparators = [{'type': 'gift_card', 'value_per_mile_cents': 0.5},
+                       {'type': 'hotel_award (example)', 'value_per_mile_cents': 0.7}]
+        merged = merge_recommendations(flights, comparators)
+        expected = sorted(flights + comparators, key=lambda x: -x['value_per_mile_cents'])
+        self.assertEqual(merged, expected)
+
+
+@unittest.skipIf(value_calc.np is None, 'numpy not installed')
+class BatchValueCalcTest(unittest.TestCase):
+    def test_batch_matches_scalar(self):
+        prices = [0.0, 5.60, 99.99, 350.0, 1234.56]
+        taxes = [5.60, 5.60, 0.0, 5.60, 89.40]
+        cpms = [0.0, 0.7, 1.3]
+        miles = value_calc.miles_needed_for_value_batch(
+            [[p] for p in prices], cpms, [[t] for t in taxes])
+        vpm = value_calc.value_per_mile_batch([[p] for p in prices], miles, [[t] for t in taxes])
+        for i, (price, tax) in enumerate(zip(prices, taxes)):
+            for j, cpm in enumerate(cpms):
+                expected = value_calc.miles_needed_for_value(price, cpm, tax)
+                self.assertEqual(miles[i][j], expected)
+                self.assertEqual(vpm[i][j], value_calc.value_per_mile(price, expected, tax))
+
+
+class MetricsTest(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        h = Histogram('t_seconds', 'test', ['stage'], buckets=(0.1, 1.0))
+        for v in (0.05, 0.1, 0.5, 3.0):
+            h.observe(v, 'parse')
+        lines = list(h.render())
+        self.assertEqual(lines[:3], ['t_seconds_bucket{stage="parse",le="0.1"} 2',
+                                     't_seconds_bucket{stage="parse",le="1.0"} 3',
+                                     't_seconds_bucket{stage="parse",le="+Inf"} 4'])
+        self.assertEqual(lines[-1], 't_seconds_count{stage="parse"} 4')
+
+    def test_metrics_endpoint_reports_stages_and_profiles_on_request(self):
+        client = webapp.app.test_client()
+        client.post('/recommend', data={'origin': 'JFK', 'destination': 'LAX',
+                                        'departure_date': '2025-09-01', 'miles_available': '30000'})
+        body = client.get('/metrics').get_data(as_text=True)
+        for stage in ('routing.parse_routes', 'recommender.rank', 'app.render'):
+            self.assertIn(f'recommend_stage_seconds_count{{stage="{stage}"}}', body)
+        self.assertIn('http_responses_total{endpoint="recommend",status="200"}', body)
+        self.assertIn('offer_cache_hit_rate', body)
+
+        # Profiling is off unless enabled, and writes a report when asked for
+        self.assertNotIn('X-Profile-File', client.get('/', headers={'X-Profile': 'cprofile'}).headers)
+        with tempfile.TemporaryDirectory() as tmp:
+            with unittest.mock.patch.multiple(profiling, PROFILE_ENABLED=True, PROFILE_DIR=Path(tmp)):
+                for mode in ('cprofile', 'sample'):
+                    path = client.get('/', headers={'X-Profile': mode}).headers['X-Profile-File']
+                    self.assertTrue(os.path.exists(path))
+
+
+class StubAmadeusMixin:
+    """
+    Runs a StubAmadeus for one test with the reference module's URLs pointed at it.
+    """
+
+    def start_stub(self, **options) -> StubAmadeus:
+        stub = StubAmadeus(**options).start()
+        self.addCleanup(stub.stop)
+        urls = {name: getattr(reference, name).replace(reference.AMADEUS_BASE_URL, stub.base_url)
+                for name in ('TOKEN_URL', 'OFFERS_URL', 'PRICING_URL')}
+        patcher = unittest.mock.patch.multiple(reference, **urls)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return stub
+
+
+class BenchmarkFixturesTest(StubAmadeusMixin, unittest.TestCase):
+    def test_stub_server_serves_generated_offers(self):
+        payload = generate_offers(20, segments=3, seed=1)
+        self.assertEqual(set(payload), {'meta', 'data', 'dictionaries'})
+        routes = parse_routes(payload)
+        self.assertEqual(len(routes), 20)
+        self.assertTrue(all(len(r.segments) == 3 for r in routes))
+        self.assertEqual([r.price_total for r in routes], sorted(r.price_total for r in routes))
+
+        stub = self.start_stub()
+        client = AmadeusClient(client_id='id', client_secret='secret')
+        offers = client.search_flights('JFK', 'LAX', '2025-09-01', max_results=7)
+        self.assertEqual(len(offers['data']), 7)
+        self.assertEqual(list(client.iter_flight_offers('JFK', 'LAX', '2025-09-01', max_results=7)),
+                         offers['data'])
+        priced = client.confirm_offer_price(offers['data'][0])['data']['flightOffers'][0]
+        self.assertIn('taxes', priced['travelerPricings'][0]['price'])
+        client.close()
+        self.assertEqual(stub.requests['token'], 1)
+
+
+class PricingTest(StubAmadeusMixin, unittest.TestCase):
+    def test_batch_confirmation_is_cached_and_bounded_by_deadline(self):
+        pricing.priced_offers.clear()
+        self.assertEqual(pricing.confirm_prices(parse_routes(_mock_offers_json('JFK', 'LAX'), keep_offers=False)), {})
+
+        stub = self.start_stub()
+        client = reference.AsyncAmadeusClient(AmadeusClient(client_id='id', client_secret='secret'))
+        routes = parse_routes(client.client.search_flights('JFK', 'LAX', '2025-09-01', max_results=8))
+        confirmed = pricing.confirm_prices(routes, client=client)
+        self.assertEqual(set(confirmed), {pricing.pricing_key(r) for r in routes})
+        self.assertEqual(stub.requests['pricing'], 2)  # 6 + 2 offers per call
+        self.assertEqual(asyncio.run(pricing.confirm_prices_async(routes, client=client)), confirmed)
+        self.assertEqual(stub.requests['pricing'], 2)
+
+        candidate = recommender._flight_candidate(routes[0], 30000, 'JFK', 'LAX', '2025-09-01')
+        recommender._apply_confirmed_prices([candidate], confirmed, 30000)
+        exported = candidate.to_dict()
+        self.assertTrue(exported['price_confirmed'])
+        self.assertEqual(exported['taxes_usd'], confirmed[pricing.pricing_key(routes[0])]['taxes_usd'])
+
+        # A slow pricing call misses the deadline but still fills the cache for the next view
+        stub.latency = 0.3
+        late = parse_routes(client.client.search_flights('JFK', 'LAX', '2025-09-02', max_results=2))
+        self.assertEqual(pricing.confirm_prices(late, deadline=0.05, client=client), {})
+        time.sleep(0.5)
+        self.assertEqual(len(pricing.confirm_prices(late, deadline=0.05, client=client)), 2)
+        client.client.close()
+
+    def test_priced_offers_are_matched_by_id_not_position(self):
+        pricing.priced_offers.clear()
+        stub = self.start_stub()
+        # Amadeus may reorder priced offers and leave some out
+        stub.pricing_hook = lambda offers: [o for o in reversed(offers) if o['id'] != '2']
+        client = reference.AsyncAmadeusClient(AmadeusClient(client_id='id', client_secret='secret'))
+        # Two searches in one batch, both numbering their offers from "1"
+        routes = (parse_routes(client.client.search_flights('JFK', 'LAX', '2025-09-01', max_results=3)) +
+                  parse_routes(client.client.search_flights('JFK', 'SFO', '2025-09-01', max_results=3)))
+        self.assertEqual([r.offer['id'] for r in routes], ['1', '2', '3'] * 2)
+
+        confirmed = pricing.confirm_prices(routes, client=client)
+        self.assertEqual(stub.requests['pricing'], 1)
+        self.assertEqual(set(confirmed), {pricing.pricing_key(r) for i, r in enumerate(routes) if i != 1})
+        for r in routes:
+            if pricing.pricing_key(r) in confirmed:
+                self.assertEqual(confirmed[pricing.pricing_key(r)]['price_total'], r.price_total)
+        self.assertEqual(routes[0].offer['id'], '1')  # ids are rewritten on copies only
+        client.client.close()
+
+
+class CircuitBreakerTest(StubAmadeusMixin, unittest.TestCase):
+    def test_breaker_opens_fails_fast_and_recovers_through_probe(self):
+        breaker = reference.CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, open_seconds=0.1)
+        stub = self.start_stub(error_rate=1.0)
+        tokens = TokenManager(fetch=lambda: {'access_token': 'stub-token', 'expires_in': 1799}, background=False)
+        client = AmadeusClient(client_id='id', client_secret='secret', max_retries=0,
+                               token_manager=tokens, breaker=breaker)
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                client.search_flights('JFK', 'LAX', '2025-09-01')
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(reference.CircuitOpenError):
+            client.search_flights('JFK', 'LAX', '2025-09-01')
+        self.assertEqual(stub.requests['offers'], 2)
+
+        # After open_seconds one probe goes through; its failure re-opens the breaker
+        time.sleep(0.12)
+        self.assertEqual(breaker.state, 'half_open')
+        with self.assertRaises(requests.HTTPError):
+            client.search_flights('JFK', 'LAX', '2025-09-01')
+        self.assertEqual(breaker.state, 'open')
+
+        stub.error_rate = 0.0
+        time.sleep(0.12)
+        self.assertEqual(len(client.search_flights('JFK', 'LAX', '2025-09-01', max_results=3)['data']), 3)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(client.stats()['short_circuited'], 1)
+        client.close()
+
+    def test_local_errors_do_not_count_against_the_breaker(self):
+        breaker = reference.CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, open_seconds=0.05)
+        tokens = TokenManager(fetch=lambda: {'access_token': 'tok', 'expires_in': 1799}, background=False)
+        client = AmadeusClient(client_id='id', client_secret='secret', max_retries=0,
+                               token_manager=tokens, breaker=breaker)
+        for exc in (KeyboardInterrupt, ValueError('bad request body'), KeyboardInterrupt):
+            with unittest.mock.patch.object(client.session, 'request', side_effect=exc):
+                with self.assertRaises((KeyboardInterrupt, ValueError)):
+                    client.search_flights('JFK', 'LAX', '2025-09-01')
+        self.assertEqual(breaker.state, 'closed')
+
+        # A half-open probe that is interrupted frees its slot for the next caller
+        with unittest.mock.patch.object(client.session, 'request', side_effect=requests.ConnectionError):
+            for _ in range(2):
+                with self.assertRaises(requests.ConnectionError):
+                    client.search_flights('JFK', 'LAX', '2025-09-01')
+        self.assertEqual(breaker.state, 'open')
+        time.sleep(0.06)
+        with unittest.mock.patch.object(client.session, 'request', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                client.search_flights('JFK', 'LAX', '2025-09-01')
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertTrue(breaker.allow())
+        client.close()
+
+    def test_open_breaker_fails_fast_without_spending_rate_limit_tokens(self):
+        breaker = reference.CircuitBreaker(open_seconds=60)
+        breaker._open_locked()
+        bucket = reference.TokenBucket(rate=1, burst=1)
+        bucket.acquire()
+        tokens = TokenManager(fetch=lambda: {'access_token': 'tok', 'expires_in': 1799}, background=False)
+        client = AmadeusClient(client_id='id', client_secret='secret', token_manager=tokens,
+                               rate_limiter=bucket, breaker=breaker)
+        started = time.monotonic()
+        for _ in range(3):
+            with self.assertRaises(reference.CircuitOpenError):
+                client.search_flights('JFK', 'LAX', '2025-09-01')
+        self.assertLess(time.monotonic() - started, 0.5)  # an empty bucket would have made each call wait ~1s
+        client.close()
+
+    def test_failed_search_falls_back_to_stale_cache_then_store_then_mock(self):
+        key = search_cache_key('SEA', 'SFO', '2031-01-01', 1, 10)
+        offers = _mock_offers_json('SEA', 'SFO')
+        with tempfile.TemporaryDirectory() as tmp:
+            store = OfferStore(os.path.join(tmp, 'offers.db'))
+            with unittest.mock.patch.object(routing, 'get_offer_store', return_value=store):
+                self.assertEqual(routing._fallback_offers('SEA', 'SFO', '2031-01-01', 1, 10)[1], 'mock')
+                store.save_offers('SEA', 'SFO', '2031-01-01', offers['data'], fetched_at=time.time() - 86400)
+                self.assertEqual(routing._fallback_offers('SEA', 'SFO', '2031-01-01', 1, 10)[1], 'stored')
+                routing.offer_cache.put(key, offers)
+                self.assertEqual(routing._fallback_offers('SEA', 'SFO', '2031-01-01', 1, 10)[1], 'stale_cache')
+        routing.offer_cache.invalidate(key)
+
+        res = recommend_best_redemptions('JFK', 'LAX', '2031-01-02', miles_available=30000)
+        self.assertEqual(res['upstream'], {'breaker': 'closed', 'degraded': True, 'sources': ['mock']})
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2) 
\ No newline at end of file
@@ -1,11 +1,20 @@
+from functools import lru_cache
 from math import ceil
 from typing import Dict
 
+try:
+    import numpy as np
+except ImportError:  # batch helpers need numpy; the scalar API does not
+    np = None
+
 # Default cents-per-mile (CPM) assumptions
 FLIGHT_AWARD_CPM = 1.3   # airline miles (average value)
 HOTEL_CPM = 0.7          # hotel points
 GIFT_CARD_CPM = 0.5      # gift cards or statement credits
 
+# Award taxes/fees assumed for a flight until its price is confirmed (US domestic segment fee)
+ESTIMATED_FLIGHT_TAXES_USD = 5.60
+
 
 def value_per_mile(cash_price_usd: float, miles_used: int, taxes_fees_usd: float = 0.0) -> float:
     """
@@ -41,23 +50,83 @@ def redemption_summary(cash_price_usd: float, taxes_fees_usd: float, cpm_cents:
     }
 
 
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("numpy is required for the batch value calculations (pip install numpy)")
+
+
+def miles_needed_for_value_batch(cash_price_usd, cpm_cents, taxes_fees_usd=0.0):
+    """
+    Array version of miles_needed_for_value. Inputs broadcast against each
+    other, so prices of shape (N, 1) and CPMs of shape (M,) give an (N, M)
+    grid of scenarios. Same ceil rounding and clamping as the scalar function.
+    """
+    _require_numpy()
+    cash = np.asarray(cash_price_usd, dtype=np.float64)
+    cpm = np.asarray(cpm_cents, dtype=np.float64)
+    taxes = np.asarray(taxes_fees_usd, dtype=np.float64)
+    effective = np.maximum(cash - taxes, 0.0)
+    rate = cpm / 100.0
+    effective, rate = np.broadcast_arrays(effective, rate)
+    miles = np.zeros(effective.shape, dtype=np.float64)
+    np.divide(effective, rate, out=miles, where=rate > 0)
+    return np.ceil(miles).astype(np.int64)
+
+
+def value_per_mile_batch(cash_price_usd, miles_used, taxes_fees_usd=0.0):
+    """
+    Array version of value_per_mile (USD per mile); 0.0 wherever miles_used <= 0.
+    """
+    _require_numpy()
+    cash = np.asarray(cash_price_usd, dtype=np.float64)
+    miles = np.asarray(miles_used, dtype=np.float64)
+    taxes = np.asarray(taxes_fees_usd, dtype=np.float64)
+    effective = np.maximum(cash - taxes, 0.0)
+    effective, miles = np.broadcast_arrays(effective, miles)
+    vpm = np.zeros(effective.shape, dtype=np.float64)
+    np.divide(effective, miles, out=vpm, where=miles > 0)
+    return vpm
+
+
+def redemption_summary_batch(cash_price_usd, taxes_fees_usd, cpm_cents) -> Dict:
+    """
+    Array version of redemption_summary: dict of arrays instead of a dict of scalars.
+    Cents are rounded with numpy, which can differ from round() in the last digit
+    for values that sit exactly on a half cent.
+    """
+    miles_needed = miles_needed_for_value_batch(cash_price_usd, cpm_cents, taxes_fees_usd)
+    vpm = value_per_mile_batch(cash_price_usd, miles_needed, taxes_fees_usd)
+    return {
+        "miles_needed": miles_needed,
+        "value_per_mile_usd": vpm,
+        "value_per_mile_cents": np.round(vpm * 100, 2),
+    }
+
+
 def example_calculations() -> Dict[str, Dict]:
     """
     Example calculations for:
     - Flight redemption
     - Hotel redemption
     - Gift card redemption
+    Memoized per CPM configuration; callers get their own copies.
     """
+    examples = _example_calculations(FLIGHT_AWARD_CPM, HOTEL_CPM, GIFT_CARD_CPM)
+    return {name: dict(summary) for name, summary in examples.items()}
+
+
+@lru_cache(maxsize=8)
+def _example_calculations(flight_cpm: float, hotel_cpm: float, gift_card_cpm: float) -> Dict[str, Dict]:
     # Example inputs (adjustable)
     flight_cash = 350.00
-    flight_taxes = 5.60
+    flight_taxes = ESTIMATED_FLIGHT_TAXES_USD
     hotel_cash = 220.00
     hotel_taxes = 0.00
     gift_card_cash = 100.00  # face value
     gift_card_taxes = 0.00
 
     return {
-        "flight": redemption_summary(flight_cash, flight_taxes, FLIGHT_AWARD_CPM),
-        "hotel": redemption_summary(hotel_cash, hotel_taxes, HOTEL_CPM),
-        "gift_card": redemption_summary(gift_card_cash, gift_card_taxes, GIFT_CARD_CPM),
-    } 
\ No newline at end of file
+        "flight": redemption_summary(flight_cash, flight_taxes, flight_cpm),
+        "hotel": redemption_summary(hotel_cash, hotel_taxes, hotel_cpm),
+        "gift_card": redemption_summary(gift_card_cash, gift_card_taxes, gift_card_cpm),
+    }